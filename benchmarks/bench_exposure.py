@@ -0,0 +1,78 @@
+# Author: Xin (Bruce) Wu xwu03@villanova.edu
+# Villanova University
+# "Copyright 2023"
+
+# Compare the dict of '<CTFIPS>_<date>' strings with the integer-indexed ExposureTable.
+# usage: python -m benchmarks.bench_exposure --counties 3100 --days 30 --lookups 1000000
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from exposure import ExposureTable
+from ingest import measure_peak_memory
+
+
+def _melted_hurricane_df(nb_counties, nb_days, seed=0):
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range('2020-08-23', periods=nb_days)
+    hurricane_df = pd.DataFrame({'CTFIPS': np.arange(1001, 1001 + nb_counties)})
+    for day in dates:
+        hurricane_df[f"{day.month}/{day.day}/{day.year}"] = (rng.random(nb_counties) < 0.2).astype(int)
+    melted_hurricane_df = pd.melt(hurricane_df, id_vars=['CTFIPS'], var_name='date', value_name='affected')
+    melted_hurricane_df['date_index'] = pd.to_datetime(melted_hurricane_df['date'])
+    return melted_hurricane_df
+
+
+def _build_dict(melted_hurricane_df):
+    pair_id_date = melted_hurricane_df.apply(lambda x: str(x.CTFIPS) + "_" + x.date, axis=1)
+    return dict(zip(pair_id_date, melted_hurricane_df['affected']))
+
+
+def _timed(func, *args, repeat=1):
+    # best wall time of untraced runs, then one run under tracemalloc for the peak memory, as tracing slows
+    # down the allocations of the row-wise apply the most
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    _, peak = measure_peak_memory(func, *args)
+    return result, best, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the county x date exposure lookups')
+    parser.add_argument('--counties', type=int, default=3100)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--lookups', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=1, help='untraced runs of each build, the best is kept')
+    args = parser.parse_args()
+
+    melted_hurricane_df = _melted_hurricane_df(args.counties, args.days)
+    sample = melted_hurricane_df.sample(args.lookups, replace=True, random_state=1)
+    county_ids, date_strs, dates = sample['CTFIPS'].to_numpy(), sample['date'].to_numpy(), sample['date_index']
+
+    county_date_2hurricane_dict, dict_build, dict_peak = _timed(_build_dict, melted_hurricane_df, repeat=args.repeat)
+    exposure, table_build, table_peak = _timed(ExposureTable.from_melted, melted_hurricane_df,
+                                               repeat=args.repeat)
+
+    start = time.perf_counter()
+    dict_values = [county_date_2hurricane_dict[str(county_id) + '_' + date_str]
+                   for county_id, date_str in zip(county_ids, date_strs)]
+    dict_lookup = time.perf_counter() - start
+    start = time.perf_counter()
+    table_values = exposure.lookup_many(county_ids, dates)
+    table_lookup = time.perf_counter() - start
+    assert np.array_equal(dict_values, table_values)
+
+    print('%d counties x %d days, %d lookups' % (args.counties, args.days, args.lookups))
+    print('%-15s %12s %12s %14s' % ('', 'build (s)', 'lookup (s)', 'build peak (MB)'))
+    print('%-15s %12.3f %12.3f %14.1f' % ('dict of str', dict_build, dict_lookup, dict_peak / 1024 ** 2))
+    print('%-15s %12.3f %12.3f %14.1f' % ('ExposureTable', table_build, table_lookup, table_peak / 1024 ** 2))
+
+
+if __name__ == '__main__':
+    main()
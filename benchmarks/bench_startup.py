@@ -0,0 +1,49 @@
+# Author: Xin (Bruce) Wu xwu03@villanova.edu
+# Villanova University
+# "Copyright 2023"
+
+# Startup time of the analysis scripts: a fresh interpreter per run, as when a scheduler invokes a stage.
+# usage: python -m benchmarks.bench_startup --repeat 5
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# (label, python arguments) of each measured command
+COMMANDS = [('import reading', ['-c', 'import reading']),
+            ('import testing', ['-c', 'import testing']),
+            ('import plotting', ['-c', 'import plotting']),
+            ('testing.py --help', [os.path.join(ROOT, 'testing.py'), '--help']),
+            ('t-test modules', ['-c', 'import store, events, ttest_engine, scipy.stats']),
+            ('previous testing.py imports', ['-c', 'import pandas, scipy.stats, statsmodels.api, '
+                                                   'statsmodels.formula.api, bioinfokit.analys, store'])]
+
+
+def time_command(arguments, repeat):
+    """Best wall time (s) of running python with the arguments, from the repository directory"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        completed = subprocess.run([sys.executable] + arguments, cwd=ROOT, capture_output=True)
+        best = min(best, time.perf_counter() - start)
+        if completed.returncode != 0:
+            return float('nan')
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the startup time of the analysis scripts')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print('%-30s %10s' % ('command', 'time (s)'))
+    for label, arguments in COMMANDS:
+        print('%-30s %10.3f' % (label, time_command(arguments, args.repeat)))
+
+
+if __name__ == '__main__':
+    main()
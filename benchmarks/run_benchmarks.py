@@ -0,0 +1,127 @@
+# Author: Xin (Bruce) Wu xwu03@villanova.edu
+# Villanova University
+# "Copyright 2023"
+
+# Time and memory-profile each pipeline stage on synthetic inputs, and compare against stored baselines.
+# usage: python -m benchmarks.run_benchmarks --counties 100 --days 245 --scales 1 10 100 [--save-baseline]
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from benchmarks import synthetic
+from enrichment import annotate_trips
+from events import LAURA, event_ttests
+from exposure import melt_hurricane
+from figures import FIGURES, daily_aggregates, figure_series
+from ingest import read_sera, measure_peak_memory
+
+BASELINE_FILE = os.path.join(os.path.dirname(__file__), 'baselines.json')
+
+# a stage is reported as a regression when it is this much slower than its baseline
+TOLERANCE = 1.25
+
+
+def _plot_aggregates(annotated_df):
+    # the daily averages of the four figures of plotting.py
+    start_date = LAURA.time_before + timedelta(days=30)
+    end_date = LAURA.time_after - timedelta(days=30)
+    aggregates = daily_aggregates(annotated_df.loc[annotated_df.index.isin(pd.date_range(start_date, end_date))])
+    return [figure_series(aggregates, group, attribute, rolling) for _, group, attribute, rolling, _, _, _ in FIGURES]
+
+
+def _measure(func, *args, repeat=1):
+    # best wall time of untraced runs, then one run under tracemalloc for the peak memory
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    _, peak = measure_peak_memory(func, *args)
+    return result, {'seconds': best, 'peak_mb': peak / 1024 ** 2}
+
+
+def run_stages(directory, repeat=1):
+    """Run every stage on the synthetic inputs of directory and return the measurements by stage"""
+    results = {}
+    raw_hurricane_df = pd.read_csv(os.path.join(directory, 'input_hurricane_laura_rawdata3.csv'))
+    melted_hurricane_df, results['melt'] = _measure(melt_hurricane, raw_hurricane_df, repeat=repeat)
+
+    trip_df, results['ingest'] = \
+        _measure(read_sera, os.path.join(directory, 'input_county_sera_results.csv'), repeat=repeat)
+    trip_df = trip_df.set_index('date_index')
+
+    county2hurricane_dict = dict(zip(melted_hurricane_df['CTFIPS'], melted_hurricane_df['nb_affected_day']))
+    evacuation_df = pd.read_csv(os.path.join(directory, 'data_evacuation.csv'))
+    county2evacuation_dict = dict(zip(evacuation_df['CTFIPS'], evacuation_df['ORDER']))
+    county_id2geometry_dict = dict.fromkeys(county2hurricane_dict)
+    hypothetical_df, results['testing'] = \
+        _measure(event_ttests, trip_df, LAURA, county2hurricane_dict, county2evacuation_dict,
+                 county_id2geometry_dict, repeat=repeat)
+
+    annotated_df, results['annotation'] = \
+        _measure(annotate_trips, trip_df, hypothetical_df, melted_hurricane_df,
+                 datetime.combine(LAURA.start_date, datetime.min.time()),
+                 datetime.combine(LAURA.end_date, datetime.min.time()), repeat=repeat)
+
+    _, results['plot_aggregation'] = _measure(_plot_aggregates, annotated_df, repeat=repeat)
+    return results
+
+
+def compare(results, baseline):
+    """Stages slower than TOLERANCE times their baseline"""
+    regressions = []
+    for stage, measurement in results.items():
+        if stage in baseline and measurement['seconds'] > TOLERANCE * baseline[stage]['seconds']:
+            regressions.append((stage, baseline[stage]['seconds'], measurement['seconds']))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the pipeline stages on synthetic inputs')
+    parser.add_argument('--counties', type=int, default=100, help='number of counties at scale 1')
+    parser.add_argument('--days', type=int, default=245)
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 10])
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--save-baseline', action='store_true', help='store the results as the new baselines')
+    args = parser.parse_args()
+
+    baselines = {}
+    if os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE) as f:
+            baselines = json.load(f)
+
+    regressions = []
+    for scale in args.scales:
+        nb_counties = args.counties * scale
+        key = '%dx%d' % (nb_counties, args.days)
+        with tempfile.TemporaryDirectory() as directory:
+            synthetic.write_inputs(directory, nb_counties, args.days)
+            results = run_stages(directory, args.repeat)
+
+        print('scale %dx (%d counties x %d days)' % (scale, nb_counties, args.days))
+        print('  %-18s %10s %12s %10s' % ('stage', 'time (s)', 'peak (MB)', 'baseline'))
+        for stage, measurement in results.items():
+            baseline = baselines.get(key, {}).get(stage)
+            print('  %-18s %10.3f %12.1f %10s' % (stage, measurement['seconds'], measurement['peak_mb'],
+                                                  '%.3f' % baseline['seconds'] if baseline else '-'))
+        regressions += [(key,) + regression for regression in compare(results, baselines.get(key, {}))]
+        if args.save_baseline:
+            baselines[key] = results
+
+    if args.save_baseline:
+        with open(BASELINE_FILE, 'w') as f:
+            json.dump(baselines, f, indent=2)
+    for key, stage, baseline, seconds in regressions:
+        print('regression at %s: %s took %.3f s (baseline %.3f s)' % (key, stage, seconds, baseline))
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
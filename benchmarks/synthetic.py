@@ -0,0 +1,97 @@
+# Author: Xin (Bruce) Wu xwu03@villanova.edu
+# Villanova University
+# "Copyright 2023"
+
+# Synthetic SERA-, hurricane-, evacuation- and county-shaped inputs at a configurable scale.
+# usage: python -m benchmarks.synthetic output_dir --counties 600 --days 245
+
+import argparse
+import os
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from ingest import GULF_STATES, SERA_DTYPES
+
+# mobility attributes of the SERA file, drawn from a gamma distribution
+SERA_METRICS = [column for column, dtype in SERA_DTYPES.items()
+                if dtype == 'float64' and column != 'Population']
+
+
+def _county_ids(nb_counties):
+    # spread the counties over the study-area states, numbered like FIPS codes (SSCCC)
+    states = np.resize(GULF_STATES, nb_counties)
+    return states * 1000 + np.arange(nb_counties) // len(GULF_STATES) + 1, states
+
+
+def _date_str(day):
+    return f"{day.month}/{day.day}/{day.year}"
+
+
+def sera_df(nb_counties, nb_days, start_date=date(2020, 5, 1), seed=0):
+    """County x day SERA table, one row per county and day"""
+    rng = np.random.default_rng(seed)
+    county_ids, states = _county_ids(nb_counties)
+    days = pd.date_range(start_date, periods=nb_days)
+    nb_rows = nb_counties * nb_days
+    df = pd.DataFrame({'CTFIPS': np.repeat(county_ids, nb_days),
+                       'CTNAME': np.repeat(['County %d' % county_id for county_id in county_ids], nb_days),
+                       'STFIPS': np.repeat(states, nb_days),
+                       'date': np.tile([_date_str(day) for day in days], nb_counties)})
+    for column in SERA_METRICS:
+        df[column] = rng.gamma(3.0, 1.0, nb_rows)
+    df['Population'] = np.repeat(rng.integers(1000, 500000, nb_counties), nb_days).astype(float)
+    return df
+
+
+def hurricane_df(nb_counties, start_date=date(2020, 8, 23), nb_days=6, affected_share=0.3, seed=0):
+    """Raw hurricane table: CTFIPS, CTNAME and one 0/1 column per day"""
+    rng = np.random.default_rng(seed)
+    county_ids, _ = _county_ids(nb_counties)
+    df = pd.DataFrame({'CTFIPS': county_ids, 'CTNAME': ['County %d' % county_id for county_id in county_ids]})
+    for day in pd.date_range(start_date, periods=nb_days):
+        df[_date_str(day)] = (rng.random(nb_counties) < affected_share).astype(int)
+    return df
+
+
+def evacuation_df(nb_counties, share=0.25, seed=0):
+    rng = np.random.default_rng(seed)
+    county_ids, _ = _county_ids(nb_counties)
+    return pd.DataFrame({'CTFIPS': county_ids[rng.random(nb_counties) < share], 'ORDER': 'Mandatory'})
+
+
+def county_gdf(nb_counties, cell_size=0.25):
+    """County map of square cells laid out on a grid over the Gulf coast (EPSG:4269)"""
+    import geopandas as gpd
+    from shapely import box
+
+    county_ids, states = _county_ids(nb_counties)
+    nb_columns = int(np.ceil(np.sqrt(nb_counties)))
+    minx = -100.0 + (np.arange(nb_counties) % nb_columns) * cell_size
+    miny = 28.0 + (np.arange(nb_counties) // nb_columns) * cell_size
+    return gpd.GeoDataFrame({'STATEFP': ['%02d' % state for state in states],
+                             'GEOID': ['%05d' % county_id for county_id in county_ids],
+                             'NAME': ['County %d' % county_id for county_id in county_ids]},
+                            geometry=box(minx, miny, minx + cell_size, miny + cell_size), crs=4269)
+
+
+def write_inputs(directory, nb_counties, nb_days, seed=0):
+    """Write all the input files of reading.py and testing.py under their expected names"""
+    os.makedirs(os.path.join(directory, 'cb_2018_us_county_20m'), exist_ok=True)
+    sera_df(nb_counties, nb_days, seed=seed).to_csv(
+        os.path.join(directory, 'input_county_sera_results.csv'), index=False)
+    hurricane_df(nb_counties, seed=seed).to_csv(
+        os.path.join(directory, 'input_hurricane_laura_rawdata3.csv'), index=False)
+    evacuation_df(nb_counties, seed=seed).to_csv(os.path.join(directory, 'data_evacuation.csv'), index=False)
+    county_gdf(nb_counties).to_file(os.path.join(directory, 'cb_2018_us_county_20m', 'cb_2018_us_county_20m.shp'))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write synthetic inputs for the analysis scripts')
+    parser.add_argument('directory')
+    parser.add_argument('--counties', type=int, default=600)
+    parser.add_argument('--days', type=int, default=245)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    write_inputs(args.directory, args.counties, args.days, args.seed)
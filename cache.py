@@ -0,0 +1,123 @@
+# Author: Xin (Bruce) Wu xwu03@villanova.edu
+# Villanova University
+# "Copyright 2023"
+
+import hashlib
+import json
+import logging
+import os
+
+import pandas as pd
+
+import store
+
+# Stage cache: each stage records a key built from the hashes of its input files and its parameters,
+# and is skipped when the key and its outputs are unchanged since the last run.
+CACHE_FILE = os.path.join(store.STORE_DIR, 'cache.json')
+
+logger = logging.getLogger(__name__)
+
+
+def _load_manifest():
+    if not os.path.exists(CACHE_FILE):
+        return {'stages': {}, 'files': {}}
+    with open(CACHE_FILE) as f:
+        return json.load(f)
+
+
+def _save_manifest(manifest):
+    os.makedirs(os.path.dirname(CACHE_FILE), exist_ok=True)
+    with open(CACHE_FILE, 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+
+def _file_hash(path, manifest):
+    # hashing a multi-GB file is slow, so reuse the last hash while the size and mtime are unchanged
+    info = os.stat(path)
+    cached = manifest['files'].get(path)
+    if cached is not None and cached['size'] == info.st_size and cached['mtime'] == info.st_mtime_ns:
+        return cached['sha256']
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    manifest['files'][path] = {'size': info.st_size, 'mtime': info.st_mtime_ns, 'sha256': digest.hexdigest()}
+    return digest.hexdigest()
+
+
+def stage_key(inputs, params=None):
+    """Key of a stage: the hashes of its input files (all files of a directory) and its parameters"""
+    manifest = _load_manifest()
+    digest = hashlib.sha256(repr(params).encode())
+    for path in inputs:
+        if os.path.isdir(path):
+            files = sorted(os.path.join(root, name) for root, _, names in os.walk(path) for name in names)
+        else:
+            files = [path]
+        for file in files:
+            digest.update(file.encode())
+            digest.update(_file_hash(file, manifest).encode())
+    _save_manifest(manifest)
+    return digest.hexdigest()
+
+
+def is_cached(stage, key):
+    entry = _load_manifest()['stages'].get(stage)
+    return entry is not None and entry['key'] == key and all(os.path.exists(path) for path in entry['outputs'])
+
+
+def save_stage(stage, key, outputs):
+    manifest = _load_manifest()
+    manifest['stages'][stage] = {'key': key, 'outputs': list(outputs)}
+    _save_manifest(manifest)
+
+
+def county_fingerprints(trip_df, county_df=None):
+    """
+    Fingerprint of the rows of each county: the sum of the row hashes, which does not depend on the row
+    order. county_df (indexed by CTFIPS) holds county level inputs that are added to the fingerprint.
+    """
+    hashes = pd.util.hash_pandas_object(trip_df.reset_index(), index=False)
+    fingerprints = hashes.groupby(trip_df['CTFIPS'].to_numpy()).sum()
+    if county_df is not None:
+        county_hashes = pd.util.hash_pandas_object(county_df, index=False)
+        county_hashes.index = county_df.index
+        fingerprints = fingerprints + county_hashes.reindex(fingerprints.index, fill_value=0)
+    return fingerprints
+
+
+def update_county_results(stage, key, fingerprints, output_path, compute):
+    """
+    Recompute the per-county results of the counties whose fingerprints changed since the last run and
+    merge them into the previous results, kept in the store as Parquet so the merged results are the
+    same as a full recompute; output_path is a CSV export of the merged results. compute(county_ids)
+    returns the results of the given counties with the county id in the first column. All counties are
+    recomputed when the stage key changed or no previous results exist.
+    """
+    fingerprint_path = os.path.join(store.STORE_DIR, stage + '_counties.parquet')
+    results_name = stage + '_results'
+    results_path = store.table_path(results_name + '.parquet')
+    if not is_cached(stage, key) or not os.path.exists(fingerprint_path) or not os.path.exists(results_path):
+        results = compute(fingerprints.index)
+    else:
+        previous_fingerprints = pd.read_parquet(fingerprint_path)['fingerprint']
+        common = fingerprints.index.intersection(previous_fingerprints.index)
+        unchanged = common[fingerprints[common].to_numpy() == previous_fingerprints[common].to_numpy()]
+        changed = fingerprints.index.difference(unchanged)
+        logger.info('%d of %d counties changed since the last run...', len(changed), len(fingerprints))
+
+        previous = store.read_results(results_name)
+        county_column = previous.columns[0]
+        previous = previous[previous[county_column].isin(unchanged)]
+        if len(changed) == 0:
+            results = previous
+        else:
+            results = compute(changed)
+            results = pd.concat([previous, results])
+        results = results.sort_values(results.columns[0], kind='stable').reset_index(drop=True)
+
+    store.write_results(results, results_name)
+    results.to_csv(output_path)
+    pd.DataFrame({'fingerprint': fingerprints}).to_parquet(fingerprint_path)
+    save_stage(stage, key, [output_path, fingerprint_path, results_path])
+    return results
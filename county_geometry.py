@@ -0,0 +1,97 @@
+# Author: Xin (Bruce) Wu xwu03@villanova.edu
+# Villanova University
+# "Copyright 2023"
+
+import numpy as np
+import shapely
+
+import store
+
+# equal-area projection of the contiguous US (meters), used for centroids, areas and distances
+PROJECTED_CRS = 5070
+
+
+def build_county_geometry(path):
+    """
+    Read the county shapefile once and precompute the county geometry asset: the original geometries,
+    the projected geometries with their bounds, the projected centroids (and their lon/lat) and the
+    areas. Rows are sorted by CTFIPS.
+    """
+    import geopandas as gpd
+
+    counties = gpd.read_file(path)
+    projected = counties.geometry.to_crs(epsg=PROJECTED_CRS)
+    centroids = projected.centroid
+
+    asset = gpd.GeoDataFrame({'CTFIPS': counties['GEOID'].astype(int),
+                              'STFIPS': counties['STATEFP'].astype(int),
+                              'NAME': counties['NAME']},
+                             geometry=counties.geometry, crs=counties.crs)
+    asset['projected'] = projected
+    asset['centroid_x'] = centroids.x
+    asset['centroid_y'] = centroids.y
+    # centroid of the projected geometry, expressed in the CRS of the shapefile
+    geographic_centroids = centroids.to_crs(counties.crs)
+    asset['x_coord'] = geographic_centroids.x
+    asset['y_coord'] = geographic_centroids.y
+    asset['area_km2'] = projected.area / 1e6
+    bounds = projected.bounds
+    for column in ['minx', 'miny', 'maxx', 'maxy']:
+        asset[column] = bounds[column]
+    return asset.sort_values('CTFIPS').reset_index(drop=True)
+
+
+class CountyGeometry:
+    """
+    Lazy access to the county geometry asset of the store. The centroid table is read on first use, the
+    geometries only for the counties asked for, and the spatial index over the projected geometries is
+    built on the first spatial query.
+    """
+
+    def __init__(self, store_dir=store.STORE_DIR):
+        self.store_dir = store_dir
+        self._centroids = None
+        self._projected = None
+        self._tree = None
+
+    @property
+    def centroids(self):
+        """CTFIPS, STFIPS, name, projected centroid, centroid lon/lat and area of every county"""
+        if self._centroids is None:
+            self._centroids = store.read_table('counties', store_dir=self.store_dir,
+                                               columns=['CTFIPS', 'STFIPS', 'NAME', 'centroid_x', 'centroid_y',
+                                                        'x_coord', 'y_coord', 'area_km2'])
+        return self._centroids
+
+    def geometries(self, county_ids, projected=False):
+        """Geometries of the given counties, indexed by CTFIPS"""
+        column = 'projected' if projected else 'geometry'
+        counties = store.read_counties(columns=['CTFIPS', column], store_dir=self.store_dir,
+                                       filters=[('CTFIPS', 'in', [int(county_id) for county_id in county_ids])])
+        return counties.set_index('CTFIPS')[column]
+
+    @property
+    def tree(self):
+        if self._tree is None:
+            counties = store.read_counties(columns=['CTFIPS', 'projected'], store_dir=self.store_dir)
+            self._projected = counties.set_index('CTFIPS')['projected']
+            self._tree = shapely.STRtree(self._projected.to_numpy())
+        return self._tree
+
+    def nearest(self, x, y):
+        """CTFIPS of the county nearest to each projected point (x, y)"""
+        points = shapely.points(np.asarray(x, dtype=float), np.asarray(y, dtype=float))
+        point_index, county_index = self.tree.query_nearest(points, all_matches=False)
+        county_ids = np.empty(len(points), dtype=self._projected.index.dtype)
+        county_ids[point_index] = self._projected.index[county_index]
+        return county_ids
+
+    def within_distance(self, geometry, distance):
+        """CTFIPS of the counties within distance (meters) of a projected geometry, e.g. a storm track"""
+        county_index = self.tree.query(geometry, predicate='dwithin', distance=distance)
+        return np.sort(self._projected.index[county_index].to_numpy())
+
+    def intersecting(self, geometries):
+        """Pairs (geometry position, CTFIPS) of the projected geometries and the counties they intersect"""
+        geometry_index, county_index = self.tree.query(np.asarray(geometries), predicate='intersects')
+        return geometry_index, self._projected.index[county_index].to_numpy()
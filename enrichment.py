@@ -0,0 +1,53 @@
+# Author: Xin (Bruce) Wu xwu03@villanova.edu
+# Villanova University
+# "Copyright 2023"
+
+import numpy as np
+import pandas as pd
+
+from exposure import ExposureTable
+
+
+def _within_window(values, in_window):
+    # attributes are only reported during the hurricane, other days are marked as 'N/A'
+    return pd.Series(values, dtype=object).where(in_window, 'N/A').to_numpy()
+
+
+def annotate_trips(trip_df, hypothetical_df, hurricane_df, hurricane_start_date, hurricane_end_date):
+    """
+    Attach the hurricane, evacuation and t-testing attributes of each county to the daily trip table.
+
+    trip_df is indexed by date. County attributes are joined on CTFIPS and the daily hurricane flags on
+    (CTFIPS, date), then masked to the hurricane window, so every row is annotated in one vectorized pass.
+    """
+    dates = trip_df.index
+    in_window = np.asarray((dates >= hurricane_start_date) & (dates <= hurricane_end_date))
+
+    # county level attributes from the t-testing results
+    county_df = hypothetical_df.set_index('CTFIPs')
+    affected = county_df.nb_affected_days > 0
+    county_df = pd.DataFrame({
+        'group1_test>=0': (affected & (county_df.t_stat_2samp_person_trip >= 0)).astype(int),
+        'group1_test<0': (affected & (county_df.t_stat_2samp_person_trip < 0)).astype(int),
+        'evacuation': county_df.evacuation_order,
+        't_testing': county_df.t_stat_2samp_person_trip})
+    county_df = county_df.reindex(trip_df['CTFIPS'].to_numpy())
+
+    # number of affected days of each county, and if the county is affected on each date
+    county2hurricane = hurricane_df.drop_duplicates('CTFIPS').set_index('CTFIPS')['nb_affected_day']
+    nb_affected_days = county2hurricane.reindex(trip_df['CTFIPS'].to_numpy()).to_numpy()
+    # days without exposure record (e.g. before the storm track starts) are not affected
+    exposure = ExposureTable.from_melted(hurricane_df)
+    affected_by_date = np.zeros(len(trip_df), dtype=exposure.flags.dtype)
+    affected_by_date[in_window] = exposure.lookup_many(trip_df['CTFIPS'].to_numpy()[in_window], dates[in_window],
+                                                       fill_value=0)
+
+    annotation_df = pd.DataFrame({
+        'group1_test>=0': county_df['group1_test>=0'].fillna(0).astype(int).to_numpy(),
+        'group1_test<0': county_df['group1_test<0'].fillna(0).astype(int).to_numpy(),
+        'evacuation': _within_window(county_df['evacuation'].to_numpy(), in_window),
+        'nb_day_affected_hurricane': _within_window(nb_affected_days, in_window),
+        'if_affected_hurricane': _within_window(affected_by_date, in_window),
+        't_testing': _within_window(county_df['t_testing'].to_numpy(), in_window)}, index=dates)
+    # the trip columns are not copied
+    return pd.concat([trip_df, annotation_df], axis=1, copy=False)
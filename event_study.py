@@ -0,0 +1,97 @@
+# Author: Xin (Bruce) Wu xwu03@villanova.edu
+# Villanova University
+# "Copyright 2023"
+
+import numpy as np
+import pandas as pd
+
+from ttest_engine import TEST_METRICS
+
+# the metrics of the configured tests, so a metric added to the tests also gets its curves
+EVENT_STUDY_METRICS = TEST_METRICS
+# relative days around landfall, trailing rolling window and pre-landfall baseline (days)
+OFFSETS = range(-30, 31)
+ROLLING_WINDOW = 7
+BASELINE_DAYS = 28
+
+
+def _county_day_matrix(trip_df, metric, county_codes, day_numbers, nb_counties, nb_days):
+    # values of a metric as a dense (county x day) array, NaN where the SERA data has no value
+    matrix = np.full((nb_counties, nb_days), np.nan)
+    matrix[county_codes, day_numbers] = trip_df[metric].to_numpy(dtype=np.float64)
+    return matrix
+
+
+def _window_means(cum_sum, cum_count, start, end, min_count):
+    # mean of the days [start, end) of every county from the cumulative sums, NaN below min_count values
+    count = cum_count[:, end] - cum_count[:, start]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(count >= min_count, (cum_sum[:, end] - cum_sum[:, start]) / count, np.nan)
+
+
+def event_study_window(landfall_date, offsets=OFFSETS, window=ROLLING_WINDOW, baseline_days=BASELINE_DAYS):
+    """
+    First and last day of the trips used by the curves: from the start of the first rolling window (or of
+    the baseline) to the last relative day
+    """
+    landfall = pd.Timestamp(landfall_date)
+    return (landfall + pd.Timedelta(days=min(min(offsets) - window + 1, -baseline_days)),
+            landfall + pd.Timedelta(days=max(offsets)))
+
+
+def event_study(trip_df, landfall_date, metrics=EVENT_STUDY_METRICS, offsets=OFFSETS, window=ROLLING_WINDOW,
+                baseline_days=BASELINE_DAYS):
+    """
+    Event-study curves of every county and metric around landfall. trip_df is indexed by date. For each
+    relative day: the value, its trailing rolling mean over window days, the county baseline (mean of the
+    baseline_days before landfall) and both deviations from the baseline. Every window is a difference
+    of cumulative sums over the (county x day) arrays, so each offset costs O(1) per county. Returns a
+    tidy table with one row per county, metric and relative day.
+    """
+    landfall = pd.Timestamp(landfall_date)
+    first_day, last_day = event_study_window(landfall, offsets, window, baseline_days)
+    if trip_df.index.is_monotonic_increasing:
+        trip_df = trip_df.loc[first_day:last_day]
+    else:
+        trip_df = trip_df.loc[(trip_df.index >= first_day) & (trip_df.index <= last_day)]
+
+    county_codes, county_ids = pd.factorize(trip_df['CTFIPS'], sort=True)
+    day_numbers = ((trip_df.index - first_day) // pd.Timedelta(days=1)).to_numpy()
+    nb_days = (last_day - first_day).days + 1
+    landfall_day = (landfall - first_day).days
+    offsets = np.asarray(list(offsets))
+
+    curves = []
+    for metric in metrics:
+        matrix = _county_day_matrix(trip_df, metric, county_codes, day_numbers, len(county_ids), nb_days)
+        valid = ~np.isnan(matrix)
+        # cumulative sums with a leading zero column, so the window [start, end) sums to cum[end] - cum[start]
+        cum_sum = np.concatenate([np.zeros((len(county_ids), 1)), np.cumsum(np.where(valid, matrix, 0.0), axis=1)],
+                                 axis=1)
+        cum_count = np.concatenate([np.zeros((len(county_ids), 1), dtype=np.int64), np.cumsum(valid, axis=1)], axis=1)
+
+        baseline = _window_means(cum_sum, cum_count, landfall_day - baseline_days, landfall_day, 1)
+        days = landfall_day + offsets
+        values = matrix[:, days]
+        # trailing window ending on each day, complete windows only as with rolling(window).mean()
+        rolling_mean = np.column_stack([_window_means(cum_sum, cum_count, day - window + 1, day + 1, window)
+                                        for day in days])
+        curves.append(pd.DataFrame({
+            'CTFIPS': np.repeat(county_ids, len(offsets)),
+            'metric': metric,
+            'relative_day': np.tile(offsets, len(county_ids)),
+            'date': np.tile(landfall + pd.to_timedelta(offsets, unit='D'), len(county_ids)),
+            'value': values.ravel(),
+            'rolling_mean': rolling_mean.ravel(),
+            'baseline': np.repeat(baseline, len(offsets)),
+            'deviation': (values - baseline[:, None]).ravel(),
+            'rolling_deviation': (rolling_mean - baseline[:, None]).ravel()}))
+    return pd.concat(curves, ignore_index=True)
+
+
+def event_study_curves(trip_df, event, metrics=EVENT_STUDY_METRICS, offsets=OFFSETS, window=ROLLING_WINDOW,
+                       baseline_days=BASELINE_DAYS):
+    """Event-study curves around the landfall of an event"""
+    curves = event_study(trip_df, event.landfall_date, metrics, offsets, window, baseline_days)
+    curves.insert(0, 'event', event.name)
+    return curves
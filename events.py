@@ -0,0 +1,98 @@
+# Author: Xin (Bruce) Wu xwu03@villanova.edu
+# Villanova University
+# "Copyright 2023"
+
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Optional
+
+import pandas as pd
+
+from resampling import county_resampling_tests
+from ttest_engine import county_ttests
+
+
+@dataclass(frozen=True)
+class EventSpec:
+    """A hurricane event: its date window, landfall, the control periods and the affected-county input"""
+    name: str
+    start_date: date
+    end_date: date
+    # day of landfall, the origin of the event-study curves; the end of the hurricane window by default
+    landfall_date: Optional[date] = None
+    # days before the start and after the end of the hurricane used as control group (trips)
+    control_days: int = 60
+    # days before the start and after the end of the hurricane used for the covid cases
+    covid_days_before: int = 9
+    covid_days_after: int = 14
+    # store table with the number of affected days of each county, and the evacuation orders
+    hurricane_table: str = 'hurricane'
+    evacuation_file: str = 'data_evacuation.csv'
+
+    def __post_init__(self):
+        if self.landfall_date is None:
+            object.__setattr__(self, 'landfall_date', self.end_date)
+
+    @property
+    def time_before(self):
+        return self.start_date - timedelta(days=self.control_days)
+
+    @property
+    def time_after(self):
+        return self.end_date + timedelta(days=self.control_days)
+
+    @property
+    def time_before_covid(self):
+        return self.start_date - timedelta(days=self.covid_days_before)
+
+    @property
+    def time_after_covid(self):
+        return self.end_date + timedelta(days=self.covid_days_after)
+
+
+# Hurricane Laura, 8/23/2020 (a Sunday) to 8/27/2020, landfall in Louisiana on 8/27/2020
+LAURA = EventSpec('laura', date(2020, 8, 23), date(2020, 8, 27), landfall_date=date(2020, 8, 27))
+
+
+def read_events(path):
+    """
+    Read event specs from a CSV file with one event per row (name, start_date, end_date, ...); the
+    optional landfall_date column may be left empty for the events landing at the end of their window
+    """
+    date_columns = [column for column in ['start_date', 'end_date', 'landfall_date']
+                    if column in pd.read_csv(path, nrows=0).columns]
+    events_df = pd.read_csv(path, parse_dates=date_columns)
+    events = []
+    for record in events_df.to_dict('records'):
+        for column in date_columns:
+            if not pd.isna(record[column]):
+                record[column] = record[column].date()
+        events.append(EventSpec(**{key: value for key, value in record.items() if not pd.isna(value)}))
+    return events
+
+
+def focus_trips(trip_df, event):
+    """
+    Rows of a trip table indexed by date within the control window of the event, and whether each row
+    falls within the hurricane range. On a table sorted by date the window is a view, not a copy.
+    """
+    time_before, time_after = pd.Timestamp(event.time_before), pd.Timestamp(event.time_after)
+    if trip_df.index.is_monotonic_increasing:
+        focused_trip_df = trip_df.loc[time_before:time_after]
+    else:
+        focused_trip_df = trip_df.loc[(trip_df.index >= time_before) & (trip_df.index <= time_after)]
+    in_range = focused_trip_df.index.isin(pd.date_range(event.start_date, event.end_date))
+    return focused_trip_df, in_range
+
+
+def event_ttests(trip_df, event, county2hurricane_dict, county2evacuation_dict, county_id2geometry_dict):
+    """Run the per-county hypothetical tests of one event on a trip table indexed by date"""
+    focused_trip_df, in_range = focus_trips(trip_df, event)
+    return county_ttests(focused_trip_df, in_range, county2hurricane_dict, county2evacuation_dict, county_id2geometry_dict,
+                         event.time_before_covid, event.end_date, event.time_after_covid)
+
+
+def event_resampling_tests(trip_df, event, method='permutation', nb_resamples=10000, seed=0, max_workers=None):
+    """Permutation or bootstrap counterparts of the per-county tests of one event"""
+    focused_trip_df, in_range = focus_trips(trip_df, event)
+    return county_resampling_tests(focused_trip_df, in_range, method, nb_resamples, seed, max_workers)
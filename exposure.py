@@ -0,0 +1,80 @@
+# Author: Xin (Bruce) Wu xwu03@villanova.edu
+# Villanova University
+# "Copyright 2023"
+
+import numpy as np
+import pandas as pd
+
+
+def melt_hurricane(hurricane_df):
+    """
+    Unpivot the raw hurricane table (CTFIPS, CTNAME, then one 0/1 column per date) into one row per
+    county and date, with the number of affected days of each county (the sum of columns 2 - 7).
+    """
+    hurricane_df = hurricane_df.copy()
+    hurricane_df['nb_affected_day'] = hurricane_df.iloc[:, 2:8].sum(axis=1)
+    melted_hurricane_df = \
+        pd.melt(hurricane_df, id_vars=['CTFIPS', 'CTNAME', 'nb_affected_day'], var_name='date', value_name='affected')
+    # melt stacks the date columns one after the other, so each date string is only parsed once
+    date_columns = [column for column in hurricane_df.columns if column not in ['CTFIPS', 'CTNAME', 'nb_affected_day']]
+    melted_hurricane_df['date_index'] = np.repeat(pd.to_datetime(date_columns).to_numpy(), len(hurricane_df))
+    return melted_hurricane_df
+
+
+class ExposureTable:
+    """
+    County x day hurricane exposure stored as a 2-D integer array: one row per county (sorted by CTFIPS)
+    and one column per day offset from the first date. Lookups are integer indexing instead of building
+    and hashing '<CTFIPS>_<date>' strings.
+    """
+
+    def __init__(self, county_ids, start_date, flags):
+        self.county_ids = np.asarray(county_ids)
+        self.start_date = pd.Timestamp(start_date)
+        self.flags = np.asarray(flags)
+
+    @classmethod
+    def from_melted(cls, melted_df, value_column='affected'):
+        """Build the table from the melted hurricane table (CTFIPS, date_index, affected)"""
+        county_ids, county_index = np.unique(melted_df['CTFIPS'].to_numpy(), return_inverse=True)
+        dates = pd.DatetimeIndex(melted_df['date_index'])
+        start_date = dates.min()
+        day_index = (dates - start_date).days.to_numpy()
+        flags = np.zeros((len(county_ids), day_index.max() + 1), dtype=np.int8)
+        flags[county_index, day_index] = melted_df[value_column].to_numpy()
+        return cls(county_ids, start_date, flags)
+
+    @property
+    def dates(self):
+        return pd.date_range(self.start_date, periods=self.flags.shape[1])
+
+    def _indices(self, county_ids, dates):
+        county_ids = np.asarray(county_ids)
+        rows = np.searchsorted(self.county_ids, county_ids)
+        rows = np.minimum(rows, len(self.county_ids) - 1)
+        columns = (pd.DatetimeIndex(dates) - self.start_date).days.to_numpy()
+        found = (self.county_ids[rows] == county_ids) & (columns >= 0) & (columns < self.flags.shape[1])
+        return rows, columns, found
+
+    def lookup(self, county_id, day):
+        """Exposure of one county on one day, raises KeyError when the pair is not in the table"""
+        return self.lookup_many([county_id], [day])[0]
+
+    def lookup_many(self, county_ids, dates, fill_value=None):
+        """
+        Exposure of each (county, date) pair. Pairs that are not in the table raise a KeyError, or get
+        fill_value when it is given.
+        """
+        rows, columns, found = self._indices(county_ids, dates)
+        if fill_value is None and not found.all():
+            missing = np.flatnonzero(~found)[0]
+            raise KeyError((np.asarray(county_ids)[missing], pd.DatetimeIndex(dates)[missing]))
+        if found.all():
+            return self.flags[rows, columns]
+        values = np.full(len(rows), fill_value, dtype=np.result_type(self.flags.dtype, np.asarray(fill_value)))
+        values[found] = self.flags[rows[found], columns[found]]
+        return values
+
+    def affected_days(self):
+        """Number of affected days of each county"""
+        return pd.Series(self.flags.sum(axis=1), index=self.county_ids)
@@ -0,0 +1,167 @@
+# Author: Xin (Bruce) Wu xwu03@villanova.edu
+# Villanova University
+# "Copyright 2023"
+
+# Daily aggregates of the annotated trip table, computed for all groups in one grouped pass, and batch
+# rendering of the figures to files in a process pool.
+# usage: python figures.py output_dir output_focused_data.csv [more annotated files] --split STFIPS evacuation
+
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+# county groups of the figures: name -> rows of the annotated trip table in the group
+GROUPS = {
+    'all': lambda df: np.ones(len(df), dtype=bool),
+    'unaffected': lambda df: ((pd.to_numeric(df['nb_day_affected_hurricane'], errors='coerce') == 0) |
+                              (df['nb_day_affected_hurricane'] == 'N/A')).to_numpy(),
+    'group1': lambda df: (df['group1_test>=0'] == 1).to_numpy(),
+    'group2': lambda df: (df['group1_test<0'] == 1).to_numpy()}
+
+# the figures of plotting.py: (name, group, attribute, rolling window in days, xlabel, ylabel, title)
+FIGURES = [('trips', 'all', 'Trips/person', 1, 'Date', 'Number of trips', 'Time-Dependent Trip Data'),
+           ('cases_unaffected', 'unaffected', 'New cases/1000 people', 7, 'Group 1 - Date', 'Number of cases',
+            'Time-Dependent Case Data'),
+           ('cases_group1', 'group1', 'New cases/1000 people', 7, 'Group 1 - Date', 'Number of cases',
+            'Time-Dependent Case Data'),
+           ('cases_group2', 'group2', 'New cases/1000 people', 7, 'Group 2 - Date', 'Number of cases',
+            'Time-Dependent Case Data')]
+
+
+def _county_split(annotated_df, split):
+    # split value of each row; the evacuation order is only reported in the hurricane window, so it is
+    # spread to all the days of its county
+    if split != 'evacuation':
+        return annotated_df[split].to_numpy()
+    reported = annotated_df[annotated_df['evacuation'] != 'N/A']
+    county2order = reported.groupby('CTFIPS')['evacuation'].first()
+    return county2order.reindex(annotated_df['CTFIPS'].to_numpy()).fillna('N/A').to_numpy()
+
+
+def daily_totals(annotated_df, groups=GROUPS, attributes=None, split=None):
+    """
+    Daily sums and numbers of values of each attribute for each group of counties, overall or for each
+    value of split (e.g. 'STFIPS' or 'evacuation'), in a single groupby over (split, date). Returns 'sum'
+    and 'count' columns per (group, attribute) indexed by (split value, date); the totals of separate
+    blocks of dates are combined by combine_totals.
+    """
+    if attributes is None:
+        attributes = sorted({figure[2] for figure in FIGURES})
+    masks = {name: group(annotated_df) for name, group in groups.items()}
+    columns = {}
+    for attribute in attributes:
+        values = annotated_df[attribute].to_numpy(dtype=float)
+        has_value = ~np.isnan(values)
+        for name, mask in masks.items():
+            columns[('sum', name, attribute)] = np.where(mask & has_value, values, 0.0)
+            columns[('count', name, attribute)] = (mask & has_value).astype(np.int64)
+    keys = [_county_split(annotated_df, split) if split is not None else np.full(len(annotated_df), 'all'),
+            pd.DatetimeIndex(annotated_df.index).normalize()]
+    totals = pd.DataFrame(columns, index=annotated_df.index).groupby(keys).sum()
+    totals.index.names = [split or 'split', 'date']
+    return totals
+
+
+def combine_totals(totals):
+    """
+    Daily totals of several blocks of rows; a date in a single block keeps its totals unchanged. The
+    'evacuation' split needs the hurricane window of a county in the same block as its other days.
+    """
+    return pd.concat(totals).groupby(level=[0, 1]).sum()
+
+
+def daily_means(totals):
+    """Daily mean of each (group, attribute) from the daily totals"""
+    # the mean of a group without any value on a date is NaN, as with groupby().mean()
+    return totals['sum'] / totals['count'].where(totals['count'] > 0)
+
+
+def daily_aggregates(annotated_df, groups=GROUPS, attributes=None, split=None):
+    """
+    Daily mean of each attribute for each group of counties, overall or for each value of split. The
+    sums and counts of every group are computed in a single grouped pass; returns one column per (group,
+    attribute) indexed by (split value, date).
+    """
+    return daily_means(daily_totals(annotated_df, groups, attributes, split))
+
+
+def figure_series(aggregates, group, attribute, rolling=1):
+    """Daily series of one figure for each split value, smoothed by a rolling mean"""
+    series = aggregates[(group, attribute)].dropna()
+    if rolling > 1:
+        series = series.groupby(level=0, group_keys=False).apply(lambda s: s.rolling(window=rolling).mean())
+    return series
+
+
+def draw_figure(ax, series, xlabel, ylabel, title):
+    """Line plot of a daily series with automatically spaced date ticks"""
+    import matplotlib.dates as mdates
+
+    ax.plot(series.index, series.to_numpy(), color='blue')
+    locator = mdates.AutoDateLocator()
+    ax.xaxis.set_major_locator(locator)
+    ax.xaxis.set_major_formatter(mdates.ConciseDateFormatter(locator))
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel(ylabel)
+    ax.set_title(title)
+    ax.grid(True)
+
+
+def _render(task):
+    path, series, xlabel, ylabel, title = task
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(figsize=(10, 5))
+    draw_figure(ax, series, xlabel, ylabel, title)
+    fig.savefig(path, bbox_inches='tight')
+    plt.close(fig)
+    return path
+
+
+def figure_tasks(aggregates, output_dir, prefix='', figures=FIGURES):
+    """One rendering task (file path, series, labels) per figure and split value"""
+    tasks = []
+    for name, group, attribute, rolling, xlabel, ylabel, title in figures:
+        series = figure_series(aggregates, group, attribute, rolling)
+        for key, key_series in series.groupby(level=0):
+            suffix = '' if key == 'all' else '_%s' % key
+            tasks.append((os.path.join(output_dir, '%s%s%s.png' % (prefix, name, suffix)),
+                          key_series.droplevel(0), xlabel, ylabel, title + ('' if key == 'all' else ' (%s)' % key)))
+    return tasks
+
+
+def render_figures(tasks, max_workers=None):
+    """Render the figure tasks to files in a process pool, headless; returns the paths written"""
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(_render, tasks, chunksize=8))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Render the daily trip and case figures to files')
+    parser.add_argument('output_dir')
+    parser.add_argument('annotated_files', nargs='+', help='annotated trip tables (output_focused_data.csv)')
+    parser.add_argument('--split', nargs='*', default=[], help='also draw one figure per value of these columns')
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    tasks = []
+    for path in args.annotated_files:
+        # keep the 'N/A' markers of the days outside the hurricane window
+        annotated_df = pd.read_csv(path, index_col='date_index', parse_dates=['date_index'],
+                                   keep_default_na=False, na_values=[''])
+        prefix = os.path.splitext(os.path.basename(path))[0] + '_'
+        for split in [None] + args.split:
+            tasks += figure_tasks(daily_aggregates(annotated_df, split=split), args.output_dir,
+                                  prefix + ('' if split is None else split + '_'))
+    render_figures(tasks, args.workers)
+    print(len(tasks), 'figures written to', args.output_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+# Author: Xin (Bruce) Wu xwu03@villanova.edu
+# Villanova University
+# "Copyright 2023"
+
+import tracemalloc
+
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+# states of the study area: AL, AR, LA, MS, MO, OK, TN, TX
+GULF_STATES = [1, 5, 22, 28, 29, 40, 47, 48]
+
+# attributes related to mobility read from the SERA file, with the smallest dtype that holds them
+SERA_DTYPES = {'CTFIPS': 'int32', 'CTNAME': 'category', 'STFIPS': 'int8',
+               '% staying home': 'float64', 'Trips/person': 'float64', '% out-of-county trips': 'float64',
+               '% out-of-state trips': 'float64', 'Miles/person': 'float64', 'Work trips/person': 'float64',
+               'Non-work trips/person': 'float64', 'Population': 'float64', 'date': 'object',
+               'New cases/1000 people': 'float64', 'Active cases/1000 people': 'float64',
+               '#days: decreasing COVID cases': 'float64', 'Tests done/1000 people': 'float64',
+               '% working from home': 'float64'}
+
+# compact schema of the trip table: county names as categories, FIPS codes as small integers, a single
+# date column (stored as int32 day numbers) and float32 attributes
+TRIP_SCHEMA = {'CTFIPS': 'int32', 'CTNAME': 'category', 'STFIPS': 'int8', 'date_index': 'datetime64[ns]',
+               'weekday': 'int8', 'is_weekday': 'bool'}
+TRIP_SCHEMA.update({column: 'float32' for column, dtype in SERA_DTYPES.items() if dtype == 'float64'})
+TRIP_SCHEMA.update({column: 'float32' for column in ['Trips', 'Out-of-county trips/person', 'Out-of-state trips/person']})
+
+CHUNK_SIZE = 500000
+
+
+def _prepare_chunk(chunk, states):
+    # filter the states first so the derived columns are only computed for the rows we keep
+    chunk = chunk[chunk['STFIPS'].isin(states)]
+
+    # Convert the 'date' column to datetime format and mark the weekdays; the date strings are dropped
+    chunk['date_index'] = pd.to_datetime(chunk.pop('date'), format='%m/%d/%Y')
+    chunk['weekday'] = chunk['date_index'].dt.weekday
+    chunk['is_weekday'] = (chunk['weekday'] < 5)
+
+    # derived trips are computed in double precision before the attributes are downcast
+    chunk['Trips'] = chunk['Trips/person'] * chunk['Population']
+    chunk['Out-of-county trips/person'] = chunk['Trips/person'] * chunk['% out-of-county trips'] / 100
+    chunk['Out-of-state trips/person'] = chunk['Trips/person'] * chunk['% out-of-state trips'] / 100
+    return chunk.astype(TRIP_SCHEMA)
+
+
+def iter_sera(path, states=GULF_STATES, chunksize=CHUNK_SIZE):
+    """
+    Stream the SERA county file in chunks. The state filter, the column projection, the dtype
+    downcasting and the derived trip columns are applied to each chunk, so memory is bounded by the
+    chunk size; yields the prepared chunks.
+    """
+    # the STFIPS filter needs the full integer range before downcasting
+    dtypes = dict(SERA_DTYPES, CTFIPS='int64', STFIPS='int64', CTNAME='object')
+    for chunk in pd.read_csv(path, usecols=list(SERA_DTYPES), dtype=dtypes, chunksize=chunksize):
+        chunk = _prepare_chunk(chunk, states)
+        # the county names come last, as in the table assembled by read_sera
+        chunk['CTNAME'] = chunk.pop('CTNAME')
+        yield chunk
+
+
+def read_sera(path, states=GULF_STATES, chunksize=CHUNK_SIZE):
+    """
+    Read the SERA county file into one trip table. Memory is bounded by the chunk size plus the rows
+    kept, not by the size of the input file; see store.write_trip_chunks to write larger inputs.
+    """
+    chunks = list(iter_sera(path, states, chunksize))
+    if not chunks:
+        raise ValueError("no rows found in " + path)
+
+    # the category codes of each chunk differ, so merge the county names into one set of categories
+    county_names = union_categoricals([chunk['CTNAME'] for chunk in chunks])
+    trip_df = pd.concat([chunk.drop(columns='CTNAME') for chunk in chunks], ignore_index=True)
+    trip_df['CTNAME'] = county_names
+    return trip_df
+
+
+def memory_usage(df):
+    """Memory (in bytes) held by a DataFrame, including the strings of object columns"""
+    return int(df.memory_usage(deep=True).sum())
+
+
+def measure_peak_memory(func, *args, **kwargs):
+    """
+    Run func and return its result together with the peak memory (in bytes) allocated while it ran. When
+    tracemalloc is already tracing (a run report with --trace-memory), the peak is only reset and read, so
+    the tracing of the caller goes on.
+    """
+    if tracemalloc.is_tracing():
+        tracemalloc.reset_peak()
+        current, _ = tracemalloc.get_traced_memory()
+        result = func(*args, **kwargs)
+        return result, tracemalloc.get_traced_memory()[1] - current
+    tracemalloc.start()
+    try:
+        result = func(*args, **kwargs)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, peak
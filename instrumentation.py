@@ -0,0 +1,155 @@
+# Author: Xin (Bruce) Wu xwu03@villanova.edu
+# Villanova University
+# "Copyright 2023"
+
+# Instrumentation of the pipeline: wall time, CPU time, rows in/out and peak memory of every stage (and
+# county batch), collected by the active run report and written as JSON; progress messages go through
+# logging so the console output is controlled by the verbosity.
+
+import json
+import logging
+import resource
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# report collecting the stages of the current run, None when the run is not instrumented
+_active_report = None
+
+
+def configure_logging(verbosity=0):
+    """Progress messages at INFO by default, DEBUG with -v (e.g. every day of the control period), WARNING with -q"""
+    level = logging.INFO - 10 * verbosity
+    logging.basicConfig(level=max(logging.DEBUG, min(logging.ERROR, level)), format='%(message)s', stream=sys.stdout)
+
+
+def add_arguments(parser):
+    """Add the verbosity, run report and profiling options to the parser of a script"""
+    parser.add_argument('-v', '--verbose', action='count', default=0, help='more progress messages')
+    parser.add_argument('-q', '--quiet', action='count', default=0, help='fewer progress messages')
+    parser.add_argument('--report', help='write a JSON run report (time, rows and memory per stage) to this file')
+    parser.add_argument('--profile', help='write the cProfile statistics of the run to this file')
+    parser.add_argument('--trace-memory', action='store_true',
+                        help='record the peak memory of every stage with tracemalloc (slower)')
+
+
+def _max_rss_mb():
+    # high-water mark of the resident memory of the process (kilobytes on Linux)
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class RunReport:
+    """Stage records of one run, with optional memory tracing and cProfile capture"""
+
+    def __init__(self, name, trace_memory=False, profile_path=None):
+        self.name = name
+        self.started = datetime.now().isoformat(timespec='seconds')
+        self.stages = []
+        self._start = time.perf_counter()
+        self.trace_memory = trace_memory
+        self.profile_path = profile_path
+        self._open = []
+        self._profiler = None
+
+    def start(self):
+        global _active_report
+        _active_report = self
+        if self.trace_memory:
+            tracemalloc.start()
+        if self.profile_path is not None:
+            import cProfile
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        return self
+
+    def stop(self, path=None):
+        """Stop tracing and profiling, and write the report to path (JSON) when given"""
+        global _active_report
+        if self._profiler is not None:
+            self._profiler.disable()
+            self._profiler.dump_stats(self.profile_path)
+        if self.trace_memory:
+            tracemalloc.stop()
+        _active_report = None
+        if path is not None:
+            with open(path, 'w') as f:
+                json.dump(self.to_dict(), f, indent=2, default=str)
+            logger.info('run report written to %s', path)
+
+    def to_dict(self):
+        return {'run': self.name, 'started': self.started, 'argv': sys.argv, 'profile': self.profile_path,
+                'max_rss_mb': round(_max_rss_mb(), 1), 'stages': self.stages}
+
+    @contextmanager
+    def stage(self, name, rows_in=None, **info):
+        parent = self._open[-1] if self._open else None
+        record = {'stage': name if parent is None else parent['record']['stage'] + '/' + name}
+        record.update(info)
+        if rows_in is not None:
+            record['rows_in'] = int(rows_in)
+        state = {'record': record, 'peak': 0}
+        if self.trace_memory:
+            # the peak of the parent stage so far is carried over, as the peak is reset for the child
+            if parent is not None:
+                parent['peak'] = max(parent['peak'], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        self._open.append(state)
+        wall, cpu = time.perf_counter(), time.process_time()
+        record['start_s'] = round(wall - self._start, 6)
+        try:
+            yield record
+        finally:
+            record['wall_s'] = round(time.perf_counter() - wall, 6)
+            record['cpu_s'] = round(time.process_time() - cpu, 6)
+            record['max_rss_mb'] = round(_max_rss_mb(), 1)
+            self._open.pop()
+            if self.trace_memory:
+                peak = max(state['peak'], tracemalloc.get_traced_memory()[1])
+                record['peak_mb'] = round(peak / 1024 ** 2, 3)
+                tracemalloc.reset_peak()
+                if parent is not None:
+                    parent['peak'] = max(parent['peak'], peak)
+            self.stages.append(record)
+            logger.debug('%s: %.3f s', record['stage'], record['wall_s'])
+
+
+@contextmanager
+def stage(name, rows_in=None, **info):
+    """
+    Record a stage in the active run report; yields the stage record, where the caller sets 'rows_out'
+    (or other fields). Without an active report nothing is measured.
+    """
+    if _active_report is None:
+        yield {}
+    else:
+        with _active_report.stage(name, rows_in, **info) as record:
+            yield record
+
+
+def add_record(record):
+    """Add a record measured elsewhere (e.g. in a worker process) to the active run report"""
+    if _active_report is not None:
+        _active_report.stages.append(record)
+
+
+def timed_call(func, *args):
+    """Call func and return its result with the wall and CPU time of the call, e.g. in a worker process"""
+    wall, cpu = time.perf_counter(), time.process_time()
+    result = func(*args)
+    return result, {'wall_s': round(time.perf_counter() - wall, 6), 'cpu_s': round(time.process_time() - cpu, 6),
+                    'max_rss_mb': round(_max_rss_mb(), 1)}
+
+
+@contextmanager
+def run(name, args):
+    """Instrument a script run from its parsed add_arguments() options"""
+    configure_logging(args.verbose - args.quiet)
+    report = RunReport(name, args.trace_memory, args.profile).start()
+    try:
+        yield report
+    finally:
+        report.stop(args.report)
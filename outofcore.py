@@ -0,0 +1,61 @@
+# Author: Xin (Bruce) Wu xwu03@villanova.edu
+# Villanova University
+# "Copyright 2023"
+
+# Out-of-core execution over the partitioned trip store, for SERA histories larger than memory. The
+# per-county statistics read one state at a time and the annotation and daily aggregates one block of
+# dates at a time, with the dates of the event window pushed down to the Parquet scan. Each piece runs
+# the in-memory functions; as a county lies in one state and a date in one block, the outputs are
+# identical to the in-memory path.
+
+import numpy as np
+import pandas as pd
+
+import store
+
+# days of the trip table annotated and aggregated at a time
+DATE_BLOCK_DAYS = 31
+
+
+def state_trips(columns=None, start_date=None, end_date=None, store_dir=store.STORE_DIR):
+    """
+    Yield (state, trip table of the state indexed by date) for each state partition of the store, reading
+    only the given columns (with 'date_index') and date range
+    """
+    for state in store.trip_states(store_dir):
+        trip_df = store.read_trips(columns, [state], start_date, end_date, store_dir)
+        if len(trip_df) > 0:
+            yield state, trip_df.set_index('date_index')
+
+
+def date_blocks(start_date, end_date, days=DATE_BLOCK_DAYS):
+    """Consecutive (first, last) date ranges of at most days days from start_date to end_date"""
+    first_dates = pd.date_range(start_date, end_date, freq='%dD' % days)
+    return [(first_date, min(first_date + pd.Timedelta(days=days - 1), pd.Timestamp(end_date)))
+            for first_date in first_dates]
+
+
+def block_trips(columns=None, start_date=None, end_date=None, days=DATE_BLOCK_DAYS, store_dir=store.STORE_DIR):
+    """
+    Yield the trip table indexed by date one block of dates at a time, by default over all the dates of
+    the store. The rows of a block are in the order of the full table read by store.read_trips.
+    """
+    if start_date is None or end_date is None:
+        first_date, last_date = store.trip_date_range(store_dir)
+        start_date = first_date if start_date is None else start_date
+        end_date = last_date if end_date is None else end_date
+    for first_date, last_date in date_blocks(start_date, end_date, days):
+        trip_df = store.read_trips(columns, None, first_date, last_date, store_dir)
+        if len(trip_df) > 0:
+            yield trip_df.set_index('date_index')
+
+
+def concat_by_metric(curves, metrics):
+    """
+    Merge the event-study curves computed state by state into the order of the in-memory curves: metric
+    by metric, the counties in increasing order within a metric
+    """
+    curves = pd.concat(curves, ignore_index=True)
+    metric_order = curves['metric'].map({metric: i for i, metric in enumerate(metrics)}).to_numpy()
+    # lexsort is stable, so the relative days of a county stay in order
+    return curves.iloc[np.lexsort((curves['CTFIPS'].to_numpy(), metric_order))].reset_index(drop=True)
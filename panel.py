@@ -0,0 +1,127 @@
+# Author: Xin (Bruce) Wu xwu03@villanova.edu
+# Villanova University
+# "Copyright 2023"
+
+import numpy as np
+import pandas as pd
+
+from events import focus_trips
+
+# outcomes of the difference-in-differences model
+DID_METRICS = ['Trips/person', 'Miles/person', 'New cases/1000 people']
+# outcomes with a lagged response, modelled over the covid window of testing.py instead of the control window
+COVID_DID_METRICS = ['New cases/1000 people']
+
+
+def demean(values, groups, tol=1e-8, max_iterations=1000):
+    """
+    Remove the fixed effects of several groupings (e.g. county and date) from each column of values by
+    alternating projections: the group means are subtracted one grouping after the other until they
+    vanish. groups are arrays of group codes 0..n-1; returns the demeaned values and the iterations run.
+    """
+    values = np.array(values, dtype=np.float64)
+    counts = [np.bincount(codes) for codes in groups]
+    scale = tol * (1.0 + np.abs(values).max(axis=0))
+    for iteration in range(1, max_iterations + 1):
+        change = np.zeros(values.shape[1])
+        for codes, count in zip(groups, counts):
+            for j in range(values.shape[1]):
+                means = np.bincount(codes, weights=values[:, j], minlength=len(count)) / count
+                values[:, j] -= means[codes]
+                change[j] = max(change[j], np.abs(means).max())
+        if (change <= scale).all():
+            break
+    return values, iteration
+
+
+def two_way_fe(y, x, county_codes, date_codes, tol=1e-8):
+    """
+    OLS of y on the regressors x with county and date fixed effects, absorbed by demeaning instead of
+    dummy columns, and standard errors clustered by county. Returns (coefficients, standard errors,
+    number of iterations of the demeaning).
+    """
+    county_codes = pd.factorize(county_codes)[0]
+    date_codes = pd.factorize(date_codes)[0]
+    demeaned, iterations = demean(np.column_stack([y, x]), [county_codes, date_codes], tol)
+    y, x = demeaned[:, 0], demeaned[:, 1:]
+
+    xx_inv = np.linalg.pinv(x.T @ x)
+    coef = xx_inv @ (x.T @ y)
+    residuals = y - x @ coef
+
+    # cluster-robust covariance; the county fixed effects are nested in the clusters, so only the date
+    # fixed effects count in the small sample correction
+    nb_obs, nb_regressors = x.shape
+    nb_clusters = county_codes.max() + 1
+    nb_parameters = nb_regressors + date_codes.max()
+    scores = np.column_stack([np.bincount(county_codes, weights=x[:, j] * residuals, minlength=nb_clusters)
+                              for j in range(nb_regressors)])
+    correction = nb_clusters / (nb_clusters - 1.0) * (nb_obs - 1.0) / (nb_obs - nb_parameters)
+    covariance = correction * xx_inv @ (scores.T @ scores) @ xx_inv
+    return coef, np.sqrt(np.diag(covariance)), iterations
+
+
+def panel_did(trip_df, treated, post, metrics=DID_METRICS):
+    """
+    Difference-in-differences on the county-day panel: each metric is regressed on treated x post with
+    county and date fixed effects. trip_df is indexed by date; treated and post are boolean arrays over
+    its rows. Rows where a metric is missing are left out of that metric's model. Returns one row per
+    metric with the coefficient, its county-clustered standard error, t-statistic and p-value.
+    """
+    import scipy.stats as stats
+
+    county_ids = trip_df['CTFIPS'].to_numpy()
+    dates = trip_df.index.to_numpy()
+    interaction = (np.asarray(treated) & np.asarray(post)).astype(np.float64)
+    results = []
+    for metric in metrics:
+        y = trip_df[metric].to_numpy(dtype=np.float64)
+        valid = ~np.isnan(y)
+        coef, std_err, iterations = two_way_fe(y[valid], interaction[valid, None],
+                                               county_ids[valid], dates[valid])
+        nb_clusters = len(np.unique(county_ids[valid]))
+        t_stat = coef[0] / std_err[0]
+        results.append({'metric': metric, 'coef': coef[0], 'std_err': std_err[0], 't_stat': t_stat,
+                        'p_value': 2 * stats.t.sf(np.abs(t_stat), nb_clusters - 1),
+                        'nb_obs': int(valid.sum()), 'nb_counties': nb_clusters,
+                        'nb_dates': len(np.unique(dates[valid])), 'nb_iterations': iterations})
+    return pd.DataFrame(results)
+
+
+def did_window(dates, event, covid=False):
+    """
+    Rows of the model and post period of a difference-in-differences over dates. The mobility outcomes
+    use the whole control window, with the hurricane range and all the days after it as post period. The
+    covid outcomes use the covid window (time_before_covid to time_after_covid), with the days from the
+    end of the hurricane as post period, as in the case difference of testing.py. Returns (rows, post,
+    first day, first post day, last day).
+    """
+    if covid:
+        first_date, post_date, last_date = event.time_before_covid, event.end_date, event.time_after_covid
+    else:
+        first_date, post_date, last_date = event.time_before, event.start_date, event.time_after
+    dates = pd.DatetimeIndex(dates)
+    rows = (dates >= pd.Timestamp(first_date)) & (dates <= pd.Timestamp(last_date))
+    return rows, dates >= pd.Timestamp(post_date), first_date, post_date, last_date
+
+
+def event_did(trip_df, event, county2hurricane_dict, metrics=DID_METRICS):
+    """
+    Difference-in-differences of one event: counties with at least one affected day are treated, and each
+    metric is modelled over the window and post period of did_window. The output gives the window of each
+    metric (window_start, post_start, window_end).
+    """
+    focused_trip_df, _ = focus_trips(trip_df, event)
+    treated = focused_trip_df['CTFIPS'].map(county2hurricane_dict).fillna(0).to_numpy() > 0
+    did_dfs = []
+    for covid in [False, True]:
+        window_metrics = [metric for metric in metrics if (metric in COVID_DID_METRICS) == covid]
+        if not window_metrics:
+            continue
+        rows, post, first_date, post_date, last_date = did_window(focused_trip_df.index, event, covid)
+        did_df = panel_did(focused_trip_df[rows], treated[rows], post[rows], window_metrics)
+        did_df['window_start'], did_df['post_start'], did_df['window_end'] = first_date, post_date, last_date
+        did_dfs.append(did_df)
+    did_df = pd.concat(did_dfs).set_index('metric').loc[list(metrics)].reset_index()
+    did_df.insert(0, 'event', event.name)
+    return did_df
@@ -2,151 +2,160 @@
 # Villanova University
 # "Copyright 2023"
 
-import matplotlib.pyplot as plt
-from datetime import timedelta, datetime, date
-
-import pandas as pd
-
-
-def _county_attributes_mapping(county_fips, date_str, sd, ed, attributes):
-    date_index = datetime.strptime(date_str, "%m/%d/%Y")
-    if (attributes == 'evacuation') & (date_index <= ed) & (date_index >= sd):
-        value = county2evacuation_dict[county_fips]
-    elif (attributes == 'hurricane') & (date_index <= ed) & (date_index >= sd):
-        value = county2hurricane_dict[county_fips]
-    elif (attributes == 'hurricane_date') & (date_index <= ed) & (date_index >= sd):
-        value = county_date_2hurricane_dict[str(county_fips) + '_' + date_str]
-    elif (attributes == 't_testing') & (date_index <= ed) & (date_index >= sd):
-        value = county2t_test_dict[county_fips]
+# Annotate the trips of a hurricane event and plot the daily trip and case figures. The stages import
+# their modules (matplotlib only when figures are shown), so they can be imported without running.
+# usage: python plotting.py [--figure-dir figures] [--out-of-core] [-v | -q] [--report run_report.json]
+
+import argparse
+import logging
+import os
+from datetime import timedelta, datetime
+
+import instrumentation
+from instrumentation import stage
+
+logger = logging.getLogger(__name__)
+
+# directory to render the figures to, instead of showing them one by one (None)
+FIGURE_DIR = None
+# annotate and aggregate the trips one block of dates at a time, for trip tables larger than memory
+OUT_OF_CORE = False
+
+
+def _annotation_inputs(event):
+    # the hurricane table, the t-testing results and the hurricane dates used to annotate the trips
+    import pandas as pd
+    import store
+
+    # 1. read hurricane data:
+    logger.info("1. read hurricane data...")
+    # Create a dictionary of centroids, where the keys are the county names and the values are the centroid points
+    hurricane_df = store.read_table(event.hurricane_table,
+                                    columns=['CTFIPS', 'nb_affected_day', 'date_index', 'affected'])
+
+    # 2.read t-testing results
+    hypothetical_df = pd.read_csv("output_hypothetical_test.csv")
+
+    # 4. create date objects for the start and end dates of the hurricane
+    logger.info("2. create the start and end dates of the hurricane...")
+    logger.info('start time: %s ...', event.start_date)
+    logger.info('end time: %s ...', event.end_date)
+    # Convert to datetime object
+    hurricane_start_date = datetime.combine(event.start_date, datetime.min.time())
+    hurricane_end_date = datetime.combine(event.end_date, datetime.min.time())
+    return hurricane_df, hypothetical_df, hurricane_start_date, hurricane_end_date
+
+
+def plot_window(event):
+    """First and last date of the figures: the control window without its first and last 30 days"""
+    import pandas as pd
+
+    return pd.Timestamp(event.time_before + timedelta(days=30)), pd.Timestamp(event.time_after - timedelta(days=30))
+
+
+def annotate(event, output_path="output_focused_data.csv"):
+    """Steps 1 - 4: the trip table annotated with the group, hurricane and t-testing attributes of each county"""
+    import store
+    from enrichment import annotate_trips
+
+    hurricane_df, hypothetical_df, hurricane_start_date, hurricane_end_date = _annotation_inputs(event)
+
+    # 3 read trips
+    trip_df = store.read_trips()
+    # Set the 'date' column as the DataFrame index
+    trip_df.set_index('date_index', inplace=True)
+
+    # attach the group, evacuation, hurricane and t-testing attributes of each county
+    with stage('annotate_trips', rows_in=len(trip_df)) as record:
+        annotated_df = annotate_trips(trip_df, hypothetical_df, hurricane_df, hurricane_start_date,
+                                      hurricane_end_date)
+        record['rows_out'] = len(annotated_df)
+    with stage('write_csv', rows_in=len(annotated_df)):
+        annotated_df.to_csv(output_path)
+    return annotated_df
+
+
+def annotate_out_of_core(event, output_path="output_focused_data.csv"):
+    """
+    Steps 1 - 4 and the daily aggregates of the figures, one block of dates of the store at a time: each
+    block is annotated, appended to output_path and summed by date, so the annotated table is never in
+    memory. Returns the daily aggregates, the same as daily_aggregates() of the annotated table.
+    """
+    import outofcore
+    from enrichment import annotate_trips
+    from figures import combine_totals, daily_means, daily_totals
+
+    hurricane_df, hypothetical_df, hurricane_start_date, hurricane_end_date = _annotation_inputs(event)
+    start_date, end_date = plot_window(event)
+
+    totals = []
+    for i, trip_df in enumerate(outofcore.block_trips()):
+        with stage('block %d' % i, rows_in=len(trip_df)) as record:
+            annotated_df = annotate_trips(trip_df, hypothetical_df, hurricane_df, hurricane_start_date,
+                                          hurricane_end_date)
+            annotated_df.to_csv(output_path, mode='w' if i == 0 else 'a', header=(i == 0))
+            annotated_df = annotated_df.loc[start_date:end_date]
+            if len(annotated_df) > 0:
+                totals.append(daily_totals(annotated_df))
+            record['rows_out'] = len(annotated_df)
+    return daily_means(combine_totals(totals))
+
+
+def plot(event, annotated_df, figure_dir=FIGURE_DIR):
+    """5. plot the figures, shown one by one or rendered to files in figure_dir"""
+    from figures import daily_aggregates
+
+    start_date, end_date = plot_window(event)
+    # the trips are sorted by date, so the window is a slice of the DataFrame (a view)
+    annotated_df = annotated_df.loc[start_date:end_date]
+    # daily means of all the groups of the figures, in one grouped pass
+    with stage('daily_aggregates', rows_in=len(annotated_df)) as record:
+        aggregates = daily_aggregates(annotated_df)
+        record['rows_out'] = len(aggregates)
+    plot_aggregates(aggregates, figure_dir)
+
+
+def plot_aggregates(aggregates, figure_dir=FIGURE_DIR):
+    """Plot the figures from the daily aggregates"""
+    from figures import FIGURES, draw_figure, figure_series, figure_tasks, render_figures
+
+    logger.info("3. plotting")
+    if figure_dir is not None:
+        # headless: render the figures to files in a process pool
+        os.makedirs(figure_dir, exist_ok=True)
+        render_figures(figure_tasks(aggregates, figure_dir))
     else:
-        value = 'N/A'
-    return value
-
-
-# 1. read hurricane data:
-print("1. read hurricane data...")
-# Create a dictionary of centroids, where the keys are the county names and the values are the centroid points
-hurricane_df = pd.read_csv("data_hurricane.csv")
-county2hurricane_dict = dict(zip(hurricane_df['CTFIPS'], hurricane_df['nb_affected_day']))
-county_date_2hurricane_dict = dict(zip(hurricane_df['pair_id_date'], hurricane_df['affected']))
-
-# 2.read t-testing results
-hypothetical_df = pd.read_csv("output_hypothetical_test.csv")
-county2evacuation_dict = dict(zip(hypothetical_df['CTFIPs'], hypothetical_df['evacuation_order']))
-
-# 3 read trips
-trip_df = pd.read_csv("data_trips.csv")
-# Set the 'date' column as the DataFrame index
-trip_df['date_index'] = pd.to_datetime(trip_df['date'])
-trip_df.set_index('date_index', inplace=True)
-focused_trip_df = trip_df.copy()
-
-# 4. create date objects for the start and end dates of the hurricane
-print("2. create the start and end dates of the hurricane...")
-hurricane_start_date = date(2020, 8, 23)
-hurricane_end_date = date(2020, 8, 27)
-print('start time:', hurricane_start_date, '...')
-print('end time:', hurricane_end_date, '...')
-time_before = hurricane_start_date - timedelta(days=60)
-time_after = hurricane_end_date + timedelta(days=60)
-
-# 5. plot the figures for unaffected counties
-
-print("3. plotting")
-subset_df = hypothetical_df[hypothetical_df.nb_affected_days > 0]
-affected_counties_list = subset_df.CTFIPs.to_list()
-county2t_test_dict = dict(zip(hypothetical_df.CTFIPs, hypothetical_df.t_stat_2samp_person_trip))
-group1_subset_df = subset_df[subset_df.t_stat_2samp_person_trip >= 0]
-group1_counties_list = group1_subset_df.CTFIPs.to_list()
-group2_subset_df = subset_df[subset_df.t_stat_2samp_person_trip < 0]
-group2_counties_list = group2_subset_df.CTFIPs.to_list()
-
-# Convert to datetime object
-hurricane_start_date = datetime.combine(hurricane_start_date, datetime.min.time())
-hurricane_end_date = datetime.combine(hurricane_end_date, datetime.min.time())
-focused_trip_df_copy = focused_trip_df.copy()
-
-# Use .loc to modify the original DataFrame in-place
-focused_trip_df_copy.loc[:, 'group1_test>=0'] = \
-    focused_trip_df.apply(lambda x: 1 if x.CTFIPS in group1_counties_list else 0, axis=1)
-
-focused_trip_df_copy.loc[:, 'group1_test<0'] = \
-    focused_trip_df.apply(lambda x: 1 if x.CTFIPS in group2_counties_list else 0, axis=1)
-
-focused_trip_df_copy.loc[:, 'evacuation'] = \
-    focused_trip_df.apply(lambda x: _county_attributes_mapping(x.CTFIPS, x.date, hurricane_start_date,
-                                                               hurricane_end_date, 'evacuation'), axis=1)
-
-focused_trip_df_copy.loc[:, 'nb_day_affected_hurricane'] = \
-    focused_trip_df.apply(lambda x: _county_attributes_mapping(x.CTFIPS, x.date, hurricane_start_date,
-                                                               hurricane_end_date, 'hurricane'), axis=1)
-
-focused_trip_df_copy.loc[:, 'if_affected_hurricane'] = \
-    focused_trip_df.apply(lambda x: _county_attributes_mapping(x.CTFIPS, x.date, hurricane_start_date,
-                                                               hurricane_end_date, 'hurricane_date'), axis=1)
-
-focused_trip_df_copy.loc[:, 't_testing'] = \
-    focused_trip_df.apply(lambda x: _county_attributes_mapping(x.CTFIPS, x.date, hurricane_start_date,
-                                                               hurricane_end_date, 't_testing'), axis=1)
-
-focused_trip_df_copy.to_csv("output_focused_data.csv")
-
-start_date = time_before + timedelta(days=30)
-end_date = time_after - timedelta(days=30)
-# Slice the DataFrame using .loc[] and .isin()
-mask = focused_trip_df_copy.index.isin(pd.date_range(start_date, end_date))
-focused_trip_df_copy = focused_trip_df_copy.loc[mask]
-avg_trips_df = focused_trip_df_copy.groupby(['date'])['Trips/person'].mean()
-avg_trips_df.plot(kind='line', color='blue')
-# Add labels and title
-plt.xlabel('Date')
-plt.ylabel('Number of trips')
-plt.title('Time-Dependent Trip Data')
-plt.show()
-
-focused_trip_df_copy_unaffected = focused_trip_df_copy[(focused_trip_df_copy['nb_day_affected_hurricane'] == 0) |
-                                                       (focused_trip_df_copy['nb_day_affected_hurricane'] == 'N/A')]
-avg_case = focused_trip_df_copy_unaffected.groupby(['date'])['New cases/1000 people'].mean().rolling(window=7).mean()
-avg_case.plot(kind='line', color='blue')
-# Add labels and title
-plt.xlabel('Group 1 - Date')
-plt.ylabel('Number of cases')
-plt.title('Time-Dependent Case Data')
-# Set the xticks to show every x value
-plt.xticks(range(len(avg_case)), avg_case.index)
-# Rotate the xtick labels by 45 degrees
-plt.xticks(rotation=90)
-# Add grid lines to the plot
-plt.grid(True)
-plt.show()
-
-focused_trip_df_copy_group1 = focused_trip_df_copy[focused_trip_df_copy['group1_test>=0'] == 1]
-avg_case = focused_trip_df_copy_group1.groupby(['date'])['New cases/1000 people'].mean().rolling(window=7).mean()
-avg_case.plot(kind='line', color='blue')
-# Add labels and title
-plt.xlabel('Group 1 - Date')
-plt.ylabel('Number of cases')
-plt.title('Time-Dependent Case Data')
-# Set the xticks to show every x value
-plt.xticks(range(len(avg_case)), avg_case.index)
-# Rotate the xtick labels by 45 degrees
-plt.xticks(rotation=90)
-# Add grid lines to the plot
-plt.grid(True)
-plt.show()
-
-focused_trip_df_copy_group2 = focused_trip_df_copy[focused_trip_df_copy['group1_test<0'] == 1]
-avg_case = focused_trip_df_copy_group2.groupby(['date'])['New cases/1000 people'].mean().rolling(window=7).mean()
-avg_case.plot(kind='line', color='blue')
-# Add labels and title
-plt.xlabel('Group 2 - Date')
-plt.ylabel('Number of cases')
-plt.title('Time-Dependent Case Data')
-# Set the xticks to show every x value
-plt.xticks(range(len(avg_case)), avg_case.index)
-# Rotate the xtick labels by 45 degrees
-plt.xticks(rotation=90)
-# Add grid lines to the plot
-plt.grid(True)
-plt.show()
-print('END')
+        import matplotlib.pyplot as plt
+
+        for name, group, attribute, rolling, xlabel, ylabel, title in FIGURES:
+            fig, ax = plt.subplots()
+            draw_figure(ax, figure_series(aggregates, group, attribute, rolling).droplevel(0), xlabel, ylabel, title)
+            plt.show()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Annotate the trips and plot the daily trip and case figures')
+    parser.add_argument('--figure-dir', default=FIGURE_DIR, help='render the figures to files in this directory')
+    parser.add_argument('--out-of-core', action='store_true', default=OUT_OF_CORE,
+                        help='annotate and aggregate the trips one block of dates at a time')
+    instrumentation.add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    from events import LAURA
+
+    with instrumentation.run('plotting', args):
+        if args.out_of_core:
+            with stage('annotate'):
+                aggregates = annotate_out_of_core(LAURA)
+            with stage('plot'):
+                plot_aggregates(aggregates, args.figure_dir)
+        else:
+            with stage('annotate'):
+                annotated_df = annotate(LAURA)
+            with stage('plot'):
+                plot(LAURA, annotated_df, args.figure_dir)
+    logger.info('END')
+
+
+if __name__ == '__main__':
+    main()
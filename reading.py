@@ -2,70 +2,145 @@
 # Villanova University
 # "Copyright 2023"
 
-import pandas as pd
-import geopandas as gpd
-import matplotlib.pyplot as plt
-import scipy.stats as stats
-
-pd.set_option('display.max_columns', None)
-pd.set_option('display.max_rows', None)
-from datetime import date, timedelta, datetime
-
-# 1. reading hurricane data:
-# Create a dictionary of centroids, where the keys are the county names and the values are the centroid points
-hurricane_df = pd.read_csv("input_hurricane_laura_rawdata3.csv")
-hurricane_df['nb_affected_day'] = 0
-for i in range(2, 8):
-    hurricane_df['nb_affected_day'] = hurricane_df['nb_affected_day'] + hurricane_df.iloc[:, i]
-county2hurricane_dict = dict(zip(hurricane_df['CTFIPS'], hurricane_df['nb_affected_day']))
-# Use melt to unpivot the 'salary' and 'sales' columns
-melted_hurricane_df = \
-    pd.melt(hurricane_df, id_vars=['CTFIPS', 'CTNAME', 'nb_affected_day'], var_name='date', value_name='affected')
-# Convert the 'date' column to datetime format
-melted_hurricane_df['date_index'] = pd.to_datetime(melted_hurricane_df['date'])
-melted_hurricane_df['pair_id_date'] = melted_hurricane_df.apply(lambda x: str(x.CTFIPS)+"_"+x.date, axis=1)
-county_date_2hurricane_dict = dict(zip(melted_hurricane_df['pair_id_date'], melted_hurricane_df['affected']))
-melted_hurricane_df.to_csv("data_hurricane.csv")
-
-# 2. reading county map:
-counties = gpd.read_file("cb_2018_us_county_20m/cb_2018_us_county_20m.shp")
-# Check the current CRS of the GeoDataFrame
-print(counties.crs)
-
-# # Re-project the GeoDataFrame to a projected CRS (EPSG:3857)
-gdf = counties.to_crs(epsg=3857)
-counties['centroid'] = counties.centroid
-counties['centroid'] = counties.centroid
-counties['x_coord'] = counties['centroid'].x
-counties['y_coord'] = counties['centroid'].y
-counties.to_csv("data_counties.csv", index=False)
-
-# 3 read the SERA data
-trip_df = pd.read_csv("input_county_sera_results.csv")
-
-trip_df = trip_df[trip_df['STFIPS'].isin([1, 5, 22, 28, 29, 40, 47, 48])]
-
-# Convert the 'date' column to datetime format
-trip_df['date_index'] = pd.to_datetime(trip_df['date'])
-
-# Use .dt.weekday to determine the weekday of each date
-trip_df['weekday'] = trip_df['date_index'].dt.weekday
-
-# Create a new column indicating whether each date is a weekday or not
-trip_df['is_weekday'] = (trip_df['weekday'] < 5)
-
-# Select the attributes related to mobility
-focused_trip_df = trip_df[
-    {'CTFIPS', 'CTNAME', 'STFIPS', '% staying home', 'Trips/person', '% out-of-county trips',
-     '% out-of-state trips', 'Miles/person', 'Work trips/person',
-     'Non-work trips/person', 'Population',
-     'date', 'weekday', 'is_weekday', 'New cases/1000 people',
-     'Active cases/1000 people', '#days: decreasing COVID cases', 'Tests done/1000 people',
-     '% working from home'}].copy()
-focused_trip_df.loc[:, 'Trips'] = focused_trip_df['Trips/person'] * focused_trip_df['Population']
-focused_trip_df.loc[:, 'Out-of-county trips/person'] = \
-    focused_trip_df['Trips/person'] * focused_trip_df['% out-of-county trips'] / 100
-focused_trip_df.loc[:, 'Out-of-state trips/person'] = \
-    focused_trip_df['Trips/person'] * focused_trip_df['% out-of-state trips'] / 100
-
-focused_trip_df.to_csv("data_trips.csv", index=False)
+# Read the raw inputs into the store. Each numbered step is a stage function, skipped when its input
+# files and parameters are unchanged since the last run; the modules of a stage are imported by the stage.
+# usage: python reading.py [--stages hurricane counties track trips] [--out-of-core] [-v | -q]
+#                          [--report run_report.json]
+
+import argparse
+import logging
+import os
+
+import instrumentation
+from instrumentation import stage
+
+logger = logging.getLogger(__name__)
+
+# storm track (HURDAT-style CSV), when given the hurricane exposure is computed from it in step 2.1
+TRACK_FILE = "input_hurricane_laura_track.csv"
+# hours from UTC (the track times) to the local days of the SERA data: Central Daylight Time
+TRACK_UTC_OFFSET = -5
+
+STAGES = ['hurricane', 'counties', 'track', 'trips']
+
+# stream the SERA chunks into the store instead of building the trip table in memory
+OUT_OF_CORE = False
+
+
+def read_hurricane(path="input_hurricane_laura_rawdata3.csv"):
+    """1. reading hurricane data"""
+    import cache
+    import store
+
+    if os.path.exists(TRACK_FILE):
+        logger.info('hurricane exposure is computed from the storm track...')
+    elif cache.is_cached('hurricane', cache.stage_key([path])):
+        logger.info('hurricane data unchanged, skipping...')
+    else:
+        import pandas as pd
+        from exposure import melt_hurricane
+
+        # Create a dictionary of centroids, where the keys are the county names and the values are the centroid points
+        hurricane_df = pd.read_csv(path)
+        # Use melt to unpivot the date columns, one row per county and date
+        with stage('melt', rows_in=len(hurricane_df)) as record:
+            melted_hurricane_df = melt_hurricane(hurricane_df)
+            record['rows_out'] = len(melted_hurricane_df)
+        store.write_table(melted_hurricane_df, "hurricane")
+        cache.save_stage('hurricane', cache.stage_key([path]), [store.table_path('hurricane.parquet')])
+
+
+def read_county_map(directory="cb_2018_us_county_20m"):
+    """2. reading county map"""
+    import cache
+    import store
+
+    key = cache.stage_key([directory])
+    if cache.is_cached('counties', key):
+        logger.info('county map unchanged, skipping...')
+    else:
+        from county_geometry import build_county_geometry
+
+        # Precompute the projected geometries, centroids, areas and bounds of the counties
+        with stage('build_county_geometry') as record:
+            counties = build_county_geometry(os.path.join(directory, directory + ".shp"))
+            record['rows_out'] = len(counties)
+        store.write_counties(counties)
+        cache.save_stage('counties', key, [store.table_path('counties.parquet')])
+
+
+def read_track_exposure(path=TRACK_FILE, county_directory="cb_2018_us_county_20m"):
+    """2.1 hurricane exposure from the storm track"""
+    if not os.path.exists(path):
+        return
+    import cache
+    import store
+    from ingest import GULF_STATES
+
+    key = cache.stage_key([path, county_directory], params=(GULF_STATES, TRACK_UTC_OFFSET))
+    if cache.is_cached('hurricane', key):
+        logger.info('storm track unchanged, skipping...')
+    else:
+        from county_geometry import CountyGeometry
+        from track_exposure import read_track, track_exposure
+
+        # intersect the wind swaths of each day with the counties, written in the melted hurricane schema
+        with stage('track_exposure') as record:
+            melted_hurricane_df = track_exposure(read_track(path), CountyGeometry(), TRACK_UTC_OFFSET,
+                                                 GULF_STATES)
+            record['rows_out'] = len(melted_hurricane_df)
+        store.write_table(melted_hurricane_df, "hurricane")
+        cache.save_stage('hurricane', key, [store.table_path('hurricane.parquet')])
+
+
+def read_trips(path="input_county_sera_results.csv", out_of_core=OUT_OF_CORE):
+    """3 read the SERA data, out of core the chunks are written to the store as they are read"""
+    import cache
+    import store
+    from ingest import GULF_STATES, TRIP_SCHEMA
+
+    key = cache.stage_key([path], params=(GULF_STATES, TRIP_SCHEMA))
+    if cache.is_cached('trips', key):
+        logger.info('SERA data unchanged, skipping...')
+    elif out_of_core:
+        from ingest import iter_sera, measure_peak_memory
+
+        # the store is the same as with the in-memory path, so both share the cache key
+        with stage('write_trip_chunks') as record:
+            record['rows_out'], peak_memory = measure_peak_memory(store.write_trip_chunks,
+                                                                  iter_sera(path, GULF_STATES))
+        logger.info('peak memory while writing the SERA data: %.1f MB', peak_memory / 1024 ** 2)
+        cache.save_stage('trips', key, [store.table_path('trips')])
+    else:
+        from ingest import read_sera, measure_peak_memory, memory_usage
+
+        # Stream the file in chunks, keeping only the mobility attributes of the counties in the study area
+        with stage('read_sera') as record:
+            focused_trip_df, peak_memory = measure_peak_memory(read_sera, path, GULF_STATES)
+            record['rows_out'] = len(focused_trip_df)
+        logger.info('peak memory while reading the SERA data: %.1f MB', peak_memory / 1024 ** 2)
+        logger.info('trip table: %d rows, %.1f MB', len(focused_trip_df), memory_usage(focused_trip_df) / 1024 ** 2)
+
+        store.write_trips(focused_trip_df)
+        cache.save_stage('trips', key, [store.table_path('trips')])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Read the hurricane, county and SERA inputs into the store')
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES)
+    parser.add_argument('--out-of-core', action='store_true', default=OUT_OF_CORE,
+                        help='write the SERA data to the store chunk by chunk, for inputs larger than memory')
+    instrumentation.add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    stage_functions = {'hurricane': read_hurricane, 'counties': read_county_map, 'track': read_track_exposure,
+                       'trips': lambda: read_trips(out_of_core=args.out_of_core)}
+    with instrumentation.run('reading', args):
+        for name in STAGES:
+            if name in args.stages:
+                with stage(name):
+                    stage_functions[name]()
+
+
+if __name__ == '__main__':
+    main()
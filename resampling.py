@@ -0,0 +1,194 @@
+# Author: Xin (Bruce) Wu xwu03@villanova.edu
+# Villanova University
+# "Copyright 2023"
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from ttest_engine import TTESTS
+
+# nonparametric counterparts of the per-county t-tests: (name, attribute, kind, alternative)
+RESAMPLING_TESTS = TTESTS
+
+# counties per task of the process pool, and resamples drawn at once within a task
+COUNTY_CHUNK = 128
+RESAMPLE_BATCH = 250
+
+
+def _pad(values, valid):
+    # move the valid values of each row to the front, padded with zeros: (padded values, number of values)
+    order = np.argsort(~valid, axis=1, kind='stable')
+    padded = np.where(np.take_along_axis(valid, order, axis=1), np.take_along_axis(values, order, axis=1), 0.0)
+    return padded, valid.sum(axis=1)
+
+
+def _p_value(null_stats, observed, alternative):
+    # add-one estimate, so a p-value is never exactly zero
+    if alternative == 'less':
+        extreme = null_stats <= observed
+    elif alternative == 'greater':
+        extreme = null_stats >= observed
+    else:
+        extreme = np.abs(null_stats) >= np.abs(observed)
+    return (extreme.sum(axis=0) + 1.0) / (len(null_stats) + 1.0)
+
+
+def permutation_test(sample, control, nb_resamples, rng, alternative='two-sided', one_sample=False):
+    """
+    Batched permutation test of the difference of means for many independent rows at once. sample and
+    control are (rows, n) arrays padded with NaN. Each resample shuffles the pooled values of every row
+    with one argsort of random keys. The one-sample statistic (sample mean - pooled mean) is a monotone
+    function of the two-sample one under permutation, the observed values differ but not the p-values.
+    """
+    pooled = np.concatenate([sample, control], axis=1)
+    valid = ~np.isnan(pooled)
+    pooled, n = _pad(np.nan_to_num(pooled), valid)
+    k = (~np.isnan(sample)).sum(axis=1)
+    total = pooled.sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sample_mean = np.nansum(sample, axis=1) / k
+        control_mean = (total - np.nansum(sample, axis=1)) / (n - k)
+        observed = sample_mean - (total / n if one_sample else control_mean)
+
+        null_stats = []
+        positions = np.arange(pooled.shape[1])
+        for start in range(0, nb_resamples, RESAMPLE_BATCH):
+            batch = min(RESAMPLE_BATCH, nb_resamples - start)
+            keys = rng.random((batch,) + pooled.shape)
+            keys[:, positions[None, :] >= n[:, None]] = np.inf
+            shuffled = np.take_along_axis(np.broadcast_to(pooled, keys.shape), np.argsort(keys, axis=2), axis=2)
+            sample_sum = np.take_along_axis(np.cumsum(shuffled, axis=2),
+                                            np.broadcast_to(np.maximum(k - 1, 0)[None, :, None], (batch, len(k), 1)),
+                                            axis=2)[:, :, 0]
+            resampled_mean = sample_sum / k
+            reference = total / n if one_sample else (total - sample_sum) / (n - k)
+            null_stats.append(resampled_mean - reference)
+        p_value = _p_value(np.concatenate(null_stats), observed, alternative)
+    invalid = (k < 1) | (n - k < 1)
+    return np.where(invalid, np.nan, observed), np.where(invalid, np.nan, p_value)
+
+
+def _moments(values, n):
+    # mean and sample variance (ddof=1) of the first n values along the last axis
+    in_row = np.arange(values.shape[-1]) < n[..., None]
+    mean = np.where(in_row, values, 0.0).sum(axis=-1) / n
+    deviation = np.where(in_row, values - mean[..., None], 0.0)
+    return mean, (deviation * deviation).sum(axis=-1) / (n - 1)
+
+
+def _bootstrap_moments(values, n, size, width, rng, batch):
+    # means and variances of resamples of size (at most width) values drawn with replacement among the first
+    # n values of each row
+    draws = np.floor(rng.random((batch, len(n), width)) * n[None, :, None]).astype(np.int64)
+    return _moments(np.take_along_axis(values[None, :, :], draws, axis=2), size[None, :])
+
+
+def _t_1samp(mean, var, n, popmean):
+    # t statistic of ttest_engine.ttest_1samp
+    return (mean - popmean) / np.sqrt(var / n)
+
+
+def _t_ind(mean_a, var_a, n_a, mean_b, var_b, n_b):
+    # pooled-variance t statistic of ttest_engine.ttest_ind
+    pooled_var = (np.where(n_a > 1, (n_a - 1) * var_a, 0.0) + np.where(n_b > 1, (n_b - 1) * var_b, 0.0)) \
+        / (n_a + n_b - 2.0)
+    return (mean_a - mean_b) / np.sqrt(pooled_var * (1.0 / n_a + 1.0 / n_b))
+
+
+def bootstrap_test(sample, control, nb_resamples, rng, alternative='two-sided', one_sample=False):
+    """
+    Batched bootstrap-t test of the difference of means for many independent rows at once. Under the null
+    hypothesis of the t-tests, sample and control come from one distribution: both groups are resampled
+    with replacement from the pooled values, and the p-value compares the t statistic of the resamples
+    (computed as in ttest_engine) with the observed one. Neither the raw difference of means nor groups
+    resampled on their own hold the level with the few sample days of a hurricane window. The one-sample
+    test compares the sample mean with the mean of all values (sample and control), as stats.ttest_1samp
+    is used in testing.py. Returns the observed difference of means and the p-value.
+    """
+    pooled = np.concatenate([sample, control], axis=1)
+    pooled, n = _pad(np.nan_to_num(pooled), ~np.isnan(pooled))
+    sample, k = _pad(np.nan_to_num(sample), ~np.isnan(sample))
+    control, m = _pad(np.nan_to_num(control), ~np.isnan(control))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sample_mean, sample_var = _moments(sample, k)
+        control_mean, control_var = _moments(control, m)
+        pooled_mean = pooled.sum(axis=1) / n
+        observed = sample_mean - (pooled_mean if one_sample else control_mean)
+        if one_sample:
+            observed_t = _t_1samp(sample_mean, sample_var, k, pooled_mean)
+        else:
+            observed_t = _t_ind(sample_mean, sample_var, k, control_mean, control_var, m)
+
+        null_stats = []
+        for start in range(0, nb_resamples, RESAMPLE_BATCH):
+            batch = min(RESAMPLE_BATCH, nb_resamples - start)
+            resampled_mean, resampled_var = _bootstrap_moments(pooled, n, k, sample.shape[1], rng, batch)
+            if one_sample:
+                null_stats.append(_t_1samp(resampled_mean, resampled_var, k, pooled_mean))
+            else:
+                null_stats.append(_t_ind(resampled_mean, resampled_var, k,
+                                         *_bootstrap_moments(pooled, n, m, control.shape[1], rng, batch), m))
+        p_value = _p_value(np.concatenate(null_stats), observed_t, alternative)
+    invalid = (k < 1) | (m < 1)
+    # without a t statistic (a single sample value in the one-sample test, no variance) there is no p-value
+    return np.where(invalid, np.nan, observed), np.where(invalid | np.isnan(observed_t), np.nan, p_value)
+
+
+RESAMPLING_METHODS = {'permutation': permutation_test, 'bootstrap': bootstrap_test}
+
+
+def _county_matrices(focused_trip_df, in_range, attributes):
+    # weekday values of each county as a (county x date) matrix per attribute, split by hurricane window
+    weekday = focused_trip_df['is_weekday'].to_numpy(dtype=bool)
+    weekday_df = focused_trip_df[weekday]
+    in_range = pd.Series(np.asarray(in_range)[weekday], index=weekday_df.index).groupby(level=0).first()
+    matrices = {}
+    for attribute in attributes:
+        matrix = weekday_df.pivot_table(index='CTFIPS', columns=weekday_df.index, values=attribute,
+                                        aggfunc='first', dropna=False)
+        matrix = matrix.reindex(columns=in_range.index)
+        matrices[attribute] = (matrix.loc[:, in_range.to_numpy()].to_numpy(dtype=float),
+                               matrix.loc[:, ~in_range.to_numpy()].to_numpy(dtype=float))
+    return matrices, matrix.index
+
+
+def _run_chunk(args):
+    method, matrices, nb_resamples, seed = args
+    rng = np.random.default_rng(seed)
+    test = RESAMPLING_METHODS[method]
+    results = {}
+    for name, attribute, kind, alternative in RESAMPLING_TESTS:
+        sample, control = matrices[attribute]
+        results['diff_' + method + '_' + name], results['p_value_' + method + '_' + name] = \
+            test(sample, control, nb_resamples, rng, alternative, one_sample=(kind == 'one-sample'))
+    return results
+
+
+def county_resampling_tests(focused_trip_df, in_range, method='permutation', nb_resamples=10000, seed=0, max_workers=None):
+    """
+    Permutation or bootstrap counterparts of the seven per-county t-tests for all counties. The counties
+    are split into chunks run in a process pool, each with its own random stream spawned from seed, so
+    the result does not depend on the number of workers. Returns one row per county (CTFIPS index) with
+    the observed difference of means and the p-value of each test.
+    """
+    attributes = sorted({attribute for _, attribute, _, _ in RESAMPLING_TESTS})
+    matrices, county_index = _county_matrices(focused_trip_df, in_range, attributes)
+    chunks = [np.arange(start, min(start + COUNTY_CHUNK, len(county_index)))
+              for start in range(0, len(county_index), COUNTY_CHUNK)]
+    seeds = np.random.SeedSequence(seed).spawn(len(chunks))
+    tasks = [(method, {attribute: (sample[rows], control[rows]) for attribute, (sample, control) in matrices.items()},
+              nb_resamples, chunk_seed) for rows, chunk_seed in zip(chunks, seeds)]
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        chunk_results = list(executor.map(_run_chunk, tasks))
+    return pd.DataFrame({column: np.concatenate([results[column] for results in chunk_results])
+                         for column in chunk_results[0]}, index=county_index)
+
+
+def group_resampling_test(a, b, method='permutation', nb_resamples=10000, seed=0, alternative='two-sided'):
+    """Permutation or bootstrap test of the difference of means between two groups of counties"""
+    rng = np.random.default_rng(seed)
+    diff, p_value = RESAMPLING_METHODS[method](np.asarray(a, dtype=float)[None, :], np.asarray(b, dtype=float)[None, :],
+                                               nb_resamples, rng, alternative)
+    return diff[0], p_value[0]
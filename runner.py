@@ -0,0 +1,148 @@
+# Author: Xin (Bruce) Wu xwu03@villanova.edu
+# Villanova University
+# "Copyright 2023"
+
+import argparse
+import logging
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import instrumentation
+import store
+from instrumentation import stage
+from events import event_ttests, read_events
+from panel import event_did
+from ttest_engine import TRIP_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+# memory-mapped trip table of a worker process, set by _attach_trip_table
+_trip_arrays = {}
+_trip_categories = {}
+_county_id2geometry_dict = {}
+
+
+def share_trip_table(trip_df, directory):
+    """
+    Write the columns of the trip table, sorted by date, as .npy files that every worker memory-maps
+    read-only, so the table is loaded once and not copied into each worker. Categorical columns are
+    stored as codes, and their categories are returned with the file names.
+    """
+    trip_df = trip_df.sort_values('date_index', kind='stable')
+    files, categories = {}, {}
+    for column in trip_df.columns:
+        values = trip_df[column]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            categories[column] = values.cat.categories
+            values = values.cat.codes
+        files[column] = os.path.join(directory, '%d.npy' % len(files))
+        np.save(files[column], values.to_numpy())
+    return files, categories
+
+
+def _attach_trip_table(files, categories, county_id2geometry_dict):
+    for column, path in files.items():
+        _trip_arrays[column] = np.load(path, mmap_mode='r')
+    _trip_categories.update(categories)
+    _county_id2geometry_dict.update(county_id2geometry_dict)
+
+
+def _window_trip_df(start_date, end_date):
+    # the table is sorted by date, so the window is a contiguous slice of the memory-mapped arrays
+    dates = _trip_arrays['date_index']
+    lo = np.searchsorted(dates, np.datetime64(start_date, 'ns'), side='left')
+    hi = np.searchsorted(dates, np.datetime64(end_date, 'ns'), side='right')
+    columns = {}
+    for column, values in _trip_arrays.items():
+        if column in _trip_categories:
+            columns[column] = pd.Categorical.from_codes(values[lo:hi], _trip_categories[column])
+        else:
+            columns[column] = np.asarray(values[lo:hi])
+    return pd.DataFrame(columns).set_index('date_index')
+
+
+def _read_county2hurricane(event):
+    hurricane_df = store.read_table(event.hurricane_table, columns=['CTFIPS', 'nb_affected_day'])
+    return dict(zip(hurricane_df['CTFIPS'], hurricane_df['nb_affected_day']))
+
+
+def _run_event(event):
+    county2hurricane_dict = _read_county2hurricane(event)
+    county2evacuation_dict = {}
+    if event.evacuation_file is not None and os.path.exists(event.evacuation_file):
+        evacuation_df = pd.read_csv(event.evacuation_file)
+        county2evacuation_dict = dict(zip(evacuation_df['CTFIPS'], evacuation_df['ORDER']))
+
+    trip_df = _window_trip_df(event.time_before, event.time_after)
+    return event_ttests(trip_df, event, county2hurricane_dict, county2evacuation_dict, _county_id2geometry_dict)
+
+
+def _run_event_did(event):
+    trip_df = _window_trip_df(event.time_before, event.time_after)
+    return event_did(trip_df, event, _read_county2hurricane(event))
+
+
+def _run_timed(tasks, event):
+    return [instrumentation.timed_call(task, event) for task in tasks]
+
+
+def run_events(trip_df, events, county_id2geometry_dict, max_workers=None, tasks=(_run_event,)):
+    """
+    Run the per-county tests (and other tasks, e.g. _run_event_did) of a batch of events in a process
+    pool, all the tasks of an event in one job, and return one dict of results by event name per task.
+    The trip table is shared once with the workers through memory-mapped arrays. The time of every task
+    and event, measured in its worker, is added to the run report.
+    """
+    results = [{} for _ in tasks]
+    with tempfile.TemporaryDirectory() as directory:
+        files, categories = share_trip_table(trip_df[TRIP_COLUMNS], directory)
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_attach_trip_table,
+                                 initargs=(files, categories, county_id2geometry_dict)) as executor:
+            for event, event_results in zip(events, executor.map(_run_timed, [tasks] * len(events), events)):
+                for task, task_results, (result, record) in zip(tasks, results, event_results):
+                    instrumentation.add_record(dict(stage=task.__name__.strip('_') + '/' + event.name,
+                                                    rows_out=len(result), **record))
+                    task_results[event.name] = result
+    return results
+
+
+def main(argv=None):
+    # usage: python runner.py input_events.csv [-v | -q] [--report run_report.json]
+    parser = argparse.ArgumentParser(description='Run the per-county tests of a batch of events')
+    parser.add_argument('events_file', nargs='?', default="input_events.csv")
+    parser.add_argument('--workers', type=int, default=None)
+    instrumentation.add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    with instrumentation.run('runner', args):
+        events = read_events(args.events_file)
+        logger.info('running %d events...', len(events))
+
+        counties = store.read_counties(columns=['CTFIPS', 'geometry'])
+        county_id2geometry_dict = dict(zip(counties['CTFIPS'], counties['geometry']))
+
+        # only read the dates covered by at least one event
+        with stage('read_trips') as record:
+            trip_df = store.read_trips(columns=TRIP_COLUMNS,
+                                       start_date=min(event.time_before for event in events),
+                                       end_date=max(event.time_after for event in events))
+            record['rows_out'] = len(trip_df)
+
+        # the per-county tests and the difference-in-differences on the county-day panel of every event
+        with stage('events', rows_in=len(trip_df)):
+            hypothetical_results, did_results = run_events(trip_df, events, county_id2geometry_dict, args.workers,
+                                                           tasks=(_run_event, _run_event_did))
+        for name, hypothetical_df in hypothetical_results.items():
+            hypothetical_df.to_csv("output_hypothetical_test_" + name + ".csv")
+            logger.info('event %s : %d counties tested', name, len(hypothetical_df))
+        did_df = pd.concat(did_results.values())
+        did_df.to_csv("output_did.csv", index=False)
+        logger.info('\n%s', did_df)
+
+
+if __name__ == '__main__':
+    main()
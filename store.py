@@ -0,0 +1,178 @@
+# Author: Xin (Bruce) Wu xwu03@villanova.edu
+# Villanova University
+# "Copyright 2023"
+
+import os
+import shutil
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+# Columnar intermediate store shared by reading.py, testing.py and plotting.py. Tables are written as
+# Parquet so datetime, category and geometry dtypes survive the round trip, and readers load only the
+# columns, states and dates they need.
+STORE_DIR = "data_store"
+
+# the trip table is partitioned by state (one directory per STFIPS) and sorted by date inside each
+# partition, so row groups carry tight date statistics for predicate pushdown
+TRIP_PARTITION = ds.partitioning(pa.schema([('STFIPS', pa.int8())]), flavor='hive')
+ROW_GROUP_SIZE = 64 * 1024
+
+
+def table_path(name, store_dir=STORE_DIR):
+    return os.path.join(store_dir, name)
+
+
+def _filter(states=None, start_date=None, end_date=None, date_column='date_index'):
+    expression = None
+    if states is not None:
+        expression = ds.field('STFIPS').isin(list(states))
+    # the dates are stored as days (date32)
+    if start_date is not None:
+        condition = ds.field(date_column) >= pa.scalar(pd.Timestamp(start_date).date(), pa.date32())
+        expression = condition if expression is None else expression & condition
+    if end_date is not None:
+        condition = ds.field(date_column) <= pa.scalar(pd.Timestamp(end_date).date(), pa.date32())
+        expression = condition if expression is None else expression & condition
+    return expression
+
+
+def _trip_table(trip_df):
+    # Arrow table of trips with the dates as days (date32) and the county names as int32 dictionaries, so
+    # tables written from different chunks share one schema
+    table = pa.Table.from_pandas(trip_df, preserve_index=False)
+    table = table.set_column(table.schema.get_field_index('date_index'), 'date_index',
+                             table['date_index'].cast(pa.date32()))
+    if 'CTNAME' in table.column_names:
+        table = table.set_column(table.schema.get_field_index('CTNAME'), 'CTNAME',
+                                 table['CTNAME'].cast(pa.dictionary(pa.int32(), pa.string())))
+    return table
+
+
+def _partition_states(path):
+    # states with a partition directory (STFIPS=xx) in a dataset
+    return sorted(int(name.split('=', 1)[1]) for name in os.listdir(path) if name.startswith('STFIPS='))
+
+
+def write_trips(trip_df, store_dir=STORE_DIR):
+    """Write the trip table partitioned by STFIPS and sorted by date, the dates as int32 day numbers"""
+    path = table_path('trips', store_dir)
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    trip_df = trip_df.sort_values(['STFIPS', 'date_index', 'CTFIPS'])
+    ds.write_dataset(_trip_table(trip_df), path, format='parquet', partitioning=TRIP_PARTITION,
+                     max_rows_per_group=ROW_GROUP_SIZE, existing_data_behavior='overwrite_or_ignore')
+
+
+def write_trip_chunks(chunks, store_dir=STORE_DIR):
+    """
+    Write the trip table from an iterable of DataFrames (e.g. the chunks of the SERA file) without holding
+    it in memory: the chunks are appended to a staging dataset partitioned by state, then the partitions
+    are sorted by date one state at a time. The table is the same as written by write_trips; returns the
+    number of rows written.
+    """
+    path = table_path('trips', store_dir)
+    staging_path = path + '_staging'
+    for directory in [path, staging_path]:
+        if os.path.exists(directory):
+            shutil.rmtree(directory)
+    nb_rows = 0
+    for i, chunk in enumerate(chunks):
+        if len(chunk) == 0:
+            continue
+        ds.write_dataset(_trip_table(chunk), staging_path, format='parquet', partitioning=TRIP_PARTITION,
+                         basename_template='chunk-%d-{i}.parquet' % i, existing_data_behavior='overwrite_or_ignore')
+        nb_rows += len(chunk)
+    if nb_rows == 0:
+        raise ValueError("no trips to write")
+
+    # only one state is in memory at a time
+    staging = ds.dataset(staging_path, format='parquet', partitioning=TRIP_PARTITION)
+    for state in _partition_states(staging_path):
+        table = staging.to_table(filter=ds.field('STFIPS') == state)
+        table = table.sort_by([('date_index', 'ascending'), ('CTFIPS', 'ascending')])
+        ds.write_dataset(table, path, format='parquet', partitioning=TRIP_PARTITION,
+                         max_rows_per_group=ROW_GROUP_SIZE, existing_data_behavior='overwrite_or_ignore')
+    shutil.rmtree(staging_path)
+    return nb_rows
+
+
+def read_trips(columns=None, states=None, start_date=None, end_date=None, store_dir=STORE_DIR):
+    """
+    Read the trip table, loading only the given columns, states and date range. The rows are sorted by
+    date, so a date window of the table is a slice (a view) rather than a copy.
+    """
+    dataset = ds.dataset(table_path('trips', store_dir), format='parquet', partitioning=TRIP_PARTITION)
+    table = dataset.to_table(columns=columns, filter=_filter(states, start_date, end_date))
+    if 'date_index' in table.column_names:
+        table = table.sort_by([('date_index', 'ascending')])
+    return table.to_pandas(date_as_object=False)
+
+
+def trip_states(store_dir=STORE_DIR):
+    """States (STFIPS) of the trip table, from its partition directories"""
+    return _partition_states(table_path('trips', store_dir))
+
+
+def trip_date_range(store_dir=STORE_DIR):
+    """First and last date of the trip table, from the row group statistics without reading the rows"""
+    dataset = ds.dataset(table_path('trips', store_dir), format='parquet', partitioning=TRIP_PARTITION)
+    first_date, last_date = None, None
+    for fragment in dataset.get_fragments():
+        metadata = fragment.metadata
+        column = metadata.schema.names.index('date_index')
+        for i in range(metadata.num_row_groups):
+            statistics = metadata.row_group(i).column(column).statistics
+            if statistics is None or not statistics.has_min_max:
+                continue
+            first_date = statistics.min if first_date is None else min(first_date, statistics.min)
+            last_date = statistics.max if last_date is None else max(last_date, statistics.max)
+    return pd.Timestamp(first_date), pd.Timestamp(last_date)
+
+
+def write_table(df, name, store_dir=STORE_DIR):
+    """Write a small table (e.g. the melted hurricane table) as a single Parquet file"""
+    os.makedirs(store_dir, exist_ok=True)
+    df.to_parquet(table_path(name + '.parquet', store_dir), index=False)
+
+
+def read_table(name, columns=None, store_dir=STORE_DIR):
+    return pq.read_table(table_path(name + '.parquet', store_dir), columns=columns).to_pandas()
+
+
+def write_results(df, name, store_dir=STORE_DIR):
+    """
+    Write per-county results (e.g. the t-tests) as a single Parquet file, so the floats round-trip
+    exactly; a 'geometry' column of shapely objects is written as GeoParquet
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    path = table_path(name + '.parquet', store_dir)
+    if 'geometry' in df.columns:
+        import geopandas as gpd
+        gpd.GeoDataFrame(df, geometry='geometry').to_parquet(path, index=False)
+    else:
+        df.to_parquet(path, index=False)
+
+
+def read_results(name, store_dir=STORE_DIR):
+    """Read per-county results written by write_results, with the geometries as shapely objects"""
+    path = table_path(name + '.parquet', store_dir)
+    if b'geo' not in (pq.read_schema(path).metadata or {}):
+        return pd.read_parquet(path)
+    import geopandas as gpd
+    df = pd.DataFrame(gpd.read_parquet(path))
+    df['geometry'] = df['geometry'].to_numpy()
+    return df
+
+
+def write_counties(counties, store_dir=STORE_DIR):
+    """Write the county geometry asset as GeoParquet, keeping the geometries in binary form"""
+    os.makedirs(store_dir, exist_ok=True)
+    counties.to_parquet(table_path('counties.parquet', store_dir), index=False)
+
+
+def read_counties(columns=None, filters=None, store_dir=STORE_DIR):
+    import geopandas as gpd
+    return gpd.read_parquet(table_path('counties.parquet', store_dir), columns=columns, filters=filters)
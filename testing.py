@@ -2,270 +2,388 @@
 # Villanova University
 # "Copyright 2023"
 
-import pandas as pd
-import scipy.stats as stats
-from bioinfokit.analys import stat
-from datetime import date, timedelta, datetime
-import statsmodels.api as sm
-from statsmodels.formula.api import ols
-pd.set_option('display.max_columns', None)
-pd.set_option('display.max_rows', None)
-
-# 1. read hurricane data:
-print("1. read hurricane data...")
-# Create a dictionary of centroids, where the keys are the county names and the values are the centroid points
-hurricane_df = pd.read_csv("data_hurricane.csv")
-county2hurricane_dict = dict(zip(hurricane_df['CTFIPS'], hurricane_df['nb_affected_day']))
-
-# 2. read evacuation data:
-print("2. read evacuation data...")
-evacuation_df = pd.read_csv("data_evacuation.csv")
-county2evacuation_dict = dict(zip(evacuation_df['CTFIPS'], evacuation_df['ORDER']))
-
-# 3. read county data
-print("3. read county data...")
-counties = pd.read_csv("data_counties.csv")
-county_id2geometry_dict = dict(zip(counties['GEOID'], counties['geometry']))
-# county_id2centroid_dict = dict(zip(counties['GEOID'], counties['centroid']))
-
-# 4. create date objects for the start and end dates of the hurricane
-print("4. create the start and end dates of the hurricane...")
-hurricane_start_date = date(2020, 8, 23)
-hurricane_end_date = date(2020, 8, 27)
-print('start time:', hurricane_start_date, '...')
-print('end time:', hurricane_end_date, '...')
-
-# 5.1 create date objects for the start and end dates of the control group
-# 8/23/2020 is a Sunday (the start date of the hurricane)
-print("5.1 create the start and end dates of the control group (trips)...")
-time_before = hurricane_start_date - timedelta(days=60)
-time_after = hurricane_end_date + timedelta(days=60)
-# Loop over the dates and print the day of the week
-current_date = time_before
-while current_date <= time_after:
-    day_of_week = current_date.strftime('%A')
-    print(current_date.strftime('%B %d, %Y'), ':', day_of_week)
-    current_date = current_date + timedelta(days=1)
-
-print("Time period of control group is from ", time_before, ' to', hurricane_start_date,
-      " and from ", hurricane_end_date, ' to', time_after)
-
-# 5.2 create date objects for the start and end dates of the control group
-print("5.2 create the start and end dates of the control group (covid cases)...")
-time_before_covid = hurricane_start_date - timedelta(days=9)
-time_after_covid = hurricane_end_date + timedelta(days=14)
-
-# 6. read trip data
-print("6. read trip data...")
-trip_df = pd.read_csv("data_trips.csv")
-
-# Set the 'date' column as the DataFrame index
-trip_df['date_index'] = pd.to_datetime(trip_df['date'])
-trip_df.set_index('date_index', inplace=True)
-
-# Select the rows within a date range
-start_date = time_before
-end_date = time_after
-# Slice the DataFrame using .loc[] and .isin()
-mask = trip_df.index.isin(pd.date_range(start_date, end_date))
-focused_trip_df = trip_df.loc[mask].copy()
-
-# add a new column to mark whether each date falls within the given range
-focused_trip_df.loc[:, 'in_hurricane_range'] = \
-    focused_trip_df.index.isin(pd.date_range(hurricane_start_date, hurricane_end_date))
-
-# 7. hypothetical testing
-print("7.1 hypothetical testing...")
-iter_county_df = focused_trip_df.groupby('CTFIPS')  # group by county id
-county_list = []
-for county_id, subset in iter_county_df:
-    print('start doing hypothetical testing for county:', str(county_id), '...')
-    # county name
-    county_name = subset.CTNAME[0]
-
-    # state FIPs
-    state_id = subset.STFIPS[0]
-
-    # if the county is affected and how many days are affected:
-    nb_affected_days = county2hurricane_dict[county_id]
-
-    # evacuation order
-    evacuation_order = county2evacuation_dict.setdefault(county_id, 'No evacuation order')
-
-    # calculate mean and variance in population and samples
-    pop_trip_mean = subset[subset.is_weekday]['Trips/person'].mean()
-    pop_trip_var = subset[subset.is_weekday]['Trips/person'].var()
-    sample_trip_mean = subset[subset.is_weekday & subset.in_hurricane_range]['Trips/person'].mean()
-
-    # out of county trips
-    pop_out_of_county_trip_mean = \
-        subset[subset.is_weekday]['Out-of-county trips/person'].mean()
-    sample_out_of_county_trip_mean = \
-        subset[subset.is_weekday & subset.in_hurricane_range]['Out-of-county trips/person'].mean()
-
-    # out of state trips
-    pop_out_of_state_trip_mean = \
-        subset[subset.is_weekday]['Out-of-county trips/person'].mean()
-    sample_out_of_state_trip_mean = \
-        subset[subset.is_weekday & subset.in_hurricane_range]['Out-of-state trips/person'].mean()
-
-    # calculate miles
-    pop_mile_mean = \
-        subset[subset.is_weekday]['Miles/person'].mean()
-    sample_mile_mean = \
-        subset[subset.is_weekday & subset.in_hurricane_range]['Miles/person'].mean()
-
-    # calculate % of working at home
-    pop_working_at_home = \
-        subset[subset.is_weekday]['% working from home'].mean()
-    sample_working_at_home = \
-        subset[subset.is_weekday & subset.in_hurricane_range]['% working from home'].mean()
-
-    # Average cases and testing numbers before the end of hurricane
-    mask = subset.index.isin(pd.date_range(time_before_covid, hurricane_end_date))
-    covid_subset_before = subset.loc[mask]
-    before_cases = covid_subset_before['New cases/1000 people'].mean()
-    before_testing = covid_subset_before['Tests done/1000 people'].mean()
-
-    # Average cases and testing numbers after the end of hurricane
-    mask = subset.index.isin(pd.date_range(hurricane_end_date, time_after_covid))
-    covid_subset_after = subset.loc[mask]
-    after_cases = covid_subset_after['New cases/1000 people'].mean()
-    after_testing = covid_subset_after['Tests done/1000 people'].mean()
-
-    # case variation and test variations (please be attention the testing number is at state-level)
-    case_difference = after_cases - before_cases
-    test_difference = after_testing - before_testing
-
-    # test 1: One sample t-test for trip per person
-    # print('test 1')
-    sample = trip_sample = subset[subset.is_weekday & subset.in_hurricane_range]['Trips/person'].to_list()
-    t_stat_1samp_ptrip, p_value_1samp_ptrip = stats.ttest_1samp(a=sample, popmean=pop_trip_mean)
-
-    # test 2: two sample t-test for trip per person
-    # print('test 2')
-    trip_population = subset[subset.is_weekday & (~subset.in_hurricane_range)]['Trips/person'].to_list()
-    trip_sample = subset[subset.is_weekday & subset.in_hurricane_range]['Trips/person'].to_list()
-    t_stat_2samp_ptrip, p_value_2samp_ptrip = stats.ttest_ind(a=trip_sample, b=trip_population)
-
-    # test 3: two sample t-test for total trips
-    # print('test 3')
-    trip_population = subset[subset.is_weekday & (~subset.in_hurricane_range)]['Trips'].to_list()
-    trip_sample = subset[subset.is_weekday & subset.in_hurricane_range]['Trips'].to_list()
-    t_stat_2samp_ttrip, p_value_2samp_ttrip = stats.ttest_ind(a=trip_sample, b=trip_population)
-
-    # test 4: two sample t-test for trips out of county
-    # print('test 4')
-    trip_population = subset[subset.is_weekday & (~subset.in_hurricane_range)]['Out-of-county trips/person'].to_list()
-    trip_sample = subset[subset.is_weekday & subset.in_hurricane_range]['Out-of-county trips/person'].to_list()
-    # perform two sample t-test
-    t_stat_2samp_octrip, p_value_2samp_octrip = stats.ttest_ind(a=trip_sample, b=trip_population, alternative='less')
-
-    # test 5: two sample t-test for trips out of states
-    # print('test 5')
-    trip_population = subset[subset.is_weekday & (~subset.in_hurricane_range)]['Out-of-state trips/person'].to_list()
-    trip_sample = subset[subset.is_weekday & subset.in_hurricane_range]['Out-of-state trips/person'].to_list()
-    t_stat_2samp_ostrip, p_value_2samp_ostrip = stats.ttest_ind(a=trip_sample, b=trip_population, alternative='less')
-
-    # test 6: two sample t-test for % stay at home
-    # print('test 6')
-    workhome_population = subset[subset.is_weekday & (~subset.in_hurricane_range)]['% working from home'].to_list()
-    workhome_sample = subset[subset.is_weekday & subset.in_hurricane_range]['% working from home'].to_list()
-    t_stat_2samp_phome, p_value_2samp_phome = stats.ttest_ind(a=workhome_sample, b=workhome_population)
-
-    # test 7: two sample t-test for miles
-    # print('test 7')
-    trip_population = subset[subset.is_weekday & (~subset.in_hurricane_range)]['Miles/person'].to_list()
-    trip_sample = subset[subset.is_weekday & subset.in_hurricane_range]['Miles/person'].to_list()
-    t_stat_2samp_pmile, p_value_2samp_pmile = stats.ttest_ind(a=trip_sample, b=trip_population)
-
-    geometry = county_id2geometry_dict[county_id]
-
-    each_county_list = [county_id, county_name, state_id, nb_affected_days, evacuation_order,
-                        pop_trip_mean, pop_trip_var, sample_trip_mean,
-                        pop_out_of_state_trip_mean, sample_out_of_county_trip_mean,
-                        pop_out_of_state_trip_mean, sample_out_of_state_trip_mean,
-                        pop_mile_mean, sample_mile_mean,
-                        t_stat_1samp_ptrip, p_value_1samp_ptrip,
-                        t_stat_2samp_ptrip, p_value_2samp_ptrip,
-                        t_stat_2samp_ttrip, p_value_2samp_ttrip,
-                        t_stat_2samp_octrip, p_value_2samp_octrip,
-                        t_stat_2samp_ostrip, p_value_2samp_ostrip,
-                        t_stat_2samp_pmile, p_value_2samp_pmile,
-                        t_stat_2samp_phome, p_value_2samp_phome,
-                        case_difference, after_cases, before_cases,
-                        test_difference, after_testing, before_testing,
-                        geometry, t_stat_2samp_ptrip > 0, nb_affected_days > 0]
-    county_list.append(each_county_list)
-
-hypothetical_df = pd.DataFrame(county_list)
-hypothetical_df = hypothetical_df.rename(columns={0: 'CTFIPs',
-                                                  1: 'CTNAME',
-                                                  2: 'STFIPs',
-                                                  3: 'nb_affected_days',
-                                                  4: 'evacuation_order',
-                                                  5: 'pop_trip_mean', 6: 'pop_trip_var', 7: 'sample_trip_mean',
-                                                  8: 'pop_out_of_state_trip_mean', 9: 'sample_out_of_county_trip_mean',
-                                                  10: 'pop_out_of_state_trip_mean', 11: 'sample_out_of_state_trip_mean',
-                                                  12: 'pop_mile_mean', 13: 'sample_mile_mean',
-                                                  14: 't_stat_1samp_person_trip', 15: 'p_value_1samp_person_trip',
-                                                  16: 't_stat_2samp_person_trip', 17: 'p_value_2samp_person_trip',
-                                                  18: 't_stat_2samp_total_trip', 19: 'p_value_2samp_total_trip',
-                                                  20: 't_stat_2samp_out_ct_trip', 21: 'p_value_2samp_out_ct_trip',
-                                                  22: 't_stat_2samp_out_st_trip', 23: 'p_value_2samp_out_st_trip',
-                                                  24: 't_stat_2samp_person_mile', 25: 'p_value_2samp_person_mile',
-                                                  26: 't_stat_2samp_perc_work_home', 27: 'p_value_2samp_perc_work_home',
-                                                  28: 'case_difference', 29: 'after_cases', 30: 'before_cases',
-                                                  31: 'test_difference', 32: 'after_testing', 33: 'before_testing',
-                                                  34: 'geometry', 35: 'mobility_variation', 36: 'affected_hurricane'})
-
-hypothetical_df.to_csv("output_hypothetical_test.csv")
-
-w, pvalue = stats.shapiro(hypothetical_df.after_testing)
-print(w, pvalue)
-
-# Ordinary Least Squares (OLS) model
-model = \
-    ols('case_difference ~ C(mobility_variation)+C(affected_hurricane)+C(mobility_variation):C(affected_hurricane)',
-        data=hypothetical_df).fit()
-anova_table = sm.stats.anova_lm(model, type=2)
-print(anova_table)
-#
-# res = stat()
-# res.tukey_hsd(df=hypothetical_df, res_var='case_difference',
-#               xfac_var='affected_hurricane',
-#               anova_model=
-#               'case_difference ~ C(affected_hurricane)')
-# print(res.tukey_summary)
-
-# res = stat()
-# res.levene(df=hypothetical_df, res_var='case_difference', xfac_var='affected_hurricane')
-# print(res.levene)
-
-
-# test 8 compare affected counties and unaffected counties on covid cases differences
-print("7.2 compare affected counties and unaffected counties on covid cases differences....")
-subset_df_affected = hypothetical_df[hypothetical_df.nb_affected_days > 0]
-subset_df_unaffected = hypothetical_df[hypothetical_df.nb_affected_days == 0]
-case_difference_sample_affected = subset_df_affected['case_difference'].to_list()
-case_difference_sample_unaffected = subset_df_unaffected['case_difference'].to_list()
-t_stat_2samp_case, p_value_2samp_case = \
-    stats.ttest_ind(a=case_difference_sample_affected, b=case_difference_sample_unaffected)
-print("t-test:", t_stat_2samp_case)
-print("p_value:", p_value_2samp_case)
-
-# test 9 compare covid cases differences between counties with and without evacuation order
-print("7.3 compare affected counties and unaffected counties on covid cases differences....")
-subset_df_order = \
-    hypothetical_df[(hypothetical_df.nb_affected_days > 0) &
-                    ~(hypothetical_df.evacuation_order != 'No evacuation order')]
-subset_df_no_order = \
-    hypothetical_df[(hypothetical_df.nb_affected_days > 0) &
-                    ~(hypothetical_df.evacuation_order == 'No evacuation order')]
-
-case_difference_sample_affected = subset_df_order['case_difference'].to_list()
-case_difference_sample_unaffected = subset_df_no_order['case_difference'].to_list()
-t_stat_2samp_case_order, p_value_2samp_case_order = \
-    stats.ttest_ind(a=case_difference_sample_affected, b=case_difference_sample_unaffected)
-print("t-test:", t_stat_2samp_case_order)
-print("p_value", p_value_2samp_case_order)
+# Hypothetical tests of a hurricane event. Each numbered step is a stage function, and the modules of a
+# stage (scipy, statsmodels, ...) are imported by the stage, so the script starts fast and the stages
+# can be imported without running anything.
+# usage: python testing.py [--stages ttest anova case_difference did event_study] [--resampling permutation]
+#                          [--out-of-core] [-v | -q] [--report run_report.json] [--profile testing.prof]
+
+import argparse
+import logging
+from datetime import timedelta
+
+import instrumentation
+from instrumentation import stage
+
+logger = logging.getLogger(__name__)
+
+STAGES = ['ttest', 'anova', 'case_difference', 'did', 'event_study']
+
+# nonparametric p-values next to the t-tests: None, 'permutation' or 'bootstrap'
+RESAMPLING_METHOD = None
+NB_RESAMPLES = 10000
+SEED = 0
+# counties tested together, each batch is a stage of the run report
+COUNTY_BATCH = 500
+# read the trips of one state at a time for the per-county stages, for trip tables larger than memory
+OUT_OF_CORE = False
+
+
+def read_inputs(event, out_of_core=OUT_OF_CORE):
+    """
+    Steps 1 - 6: the hurricane, evacuation and county inputs as dictionaries keyed by county, and the
+    trip table of the event indexed by date (None out of core, the stages read the store themselves)
+    """
+    import pandas as pd
+    import store
+    from ttest_engine import TRIP_COLUMNS
+
+    # 1. read hurricane data:
+    logger.info("1. read hurricane data...")
+    # Create a dictionary of centroids, where the keys are the county names and the values are the centroid points
+    hurricane_df = store.read_table(event.hurricane_table, columns=['CTFIPS', 'nb_affected_day'])
+    county2hurricane_dict = dict(zip(hurricane_df['CTFIPS'], hurricane_df['nb_affected_day']))
+
+    # 2. read evacuation data:
+    logger.info("2. read evacuation data...")
+    evacuation_df = pd.read_csv(event.evacuation_file)
+    county2evacuation_dict = dict(zip(evacuation_df['CTFIPS'], evacuation_df['ORDER']))
+
+    # 3. read county data
+    logger.info("3. read county data...")
+    counties = store.read_counties(columns=['CTFIPS', 'geometry'])
+    county_id2geometry_dict = dict(zip(counties['CTFIPS'], counties['geometry']))
+    # county_id2centroid_dict = dict(zip(counties['GEOID'], counties['centroid']))
+
+    # 4. create date objects for the start and end dates of the hurricane
+    logger.info("4. create the start and end dates of the hurricane...")
+    hurricane_start_date = event.start_date
+    hurricane_end_date = event.end_date
+    logger.info('start time: %s ...', hurricane_start_date)
+    logger.info('end time: %s ...', hurricane_end_date)
+
+    # 5.1 create date objects for the start and end dates of the control group
+    # 8/23/2020 is a Sunday (the start date of the hurricane)
+    logger.info("5.1 create the start and end dates of the control group (trips)...")
+    time_before = event.time_before
+    time_after = event.time_after
+    # Loop over the dates and log the day of the week, only with -v
+    if logger.isEnabledFor(logging.DEBUG):
+        current_date = time_before
+        while current_date <= time_after:
+            logger.debug('%s : %s', current_date.strftime('%B %d, %Y'), current_date.strftime('%A'))
+            current_date = current_date + timedelta(days=1)
+
+    logger.info("Time period of control group is from %s to %s and from %s to %s",
+                time_before, hurricane_start_date, hurricane_end_date, time_after)
+
+    # 5.2 the start and end dates of the control group (covid cases) are event.time_before_covid and
+    # event.time_after_covid
+
+    # 6. read trip data
+    if out_of_core:
+        logger.info("6. trip data is read one state at a time...")
+        return None, county2hurricane_dict, county2evacuation_dict, county_id2geometry_dict
+    logger.info("6. read trip data...")
+    # Select the rows within a date range, reading only the columns used by the tests
+    with stage('read_trips') as record:
+        trip_df = store.read_trips(columns=TRIP_COLUMNS, start_date=time_before, end_date=time_after)
+        record['rows_out'] = len(trip_df)
+
+    # Set the 'date' column as the DataFrame index
+    trip_df.set_index('date_index', inplace=True)
+    return trip_df, county2hurricane_dict, county2evacuation_dict, county_id2geometry_dict
+
+
+def _window_trips(event, columns):
+    # the control window of the event with only the given columns, for the stages that need all counties
+    import store
+
+    return store.read_trips(columns=columns, start_date=event.time_before,
+                            end_date=event.time_after).set_index('date_index')
+
+
+def _county_inputs(county2hurricane_dict, county2evacuation_dict, county_id2geometry_dict):
+    # county level inputs of the tests, part of the fingerprint of each county
+    import pandas as pd
+
+    return pd.DataFrame({'nb_affected_day': pd.Series(county2hurricane_dict),
+                         'evacuation_order': pd.Series(county2evacuation_dict, dtype=object),
+                         'geometry': pd.Series(county_id2geometry_dict)})
+
+
+def _ttest_key(event):
+    # the cached results depend on the event, the columns read and the configured tests
+    import cache
+    from ttest_engine import COUNTY_STATISTICS, DIFFERENCES, TRIP_COLUMNS, TTESTS
+
+    return cache.stage_key([], params=(event, TRIP_COLUMNS, TTESTS, COUNTY_STATISTICS, DIFFERENCES))
+
+
+def hypothetical_tests(event, trip_df, county2hurricane_dict, county2evacuation_dict, county_id2geometry_dict,
+                       output_path="output_hypothetical_test.csv"):
+    """7.1 hypothetical testing, only the counties whose trips or county inputs changed are tested again"""
+    import pandas as pd
+    import cache
+    from events import event_ttests
+
+    logger.info("7.1 hypothetical testing...")
+    county_df = _county_inputs(county2hurricane_dict, county2evacuation_dict, county_id2geometry_dict)
+
+    def _test_counties(county_ids):
+        results = []
+        for start in range(0, len(county_ids), COUNTY_BATCH):
+            batch_ids = county_ids[start:start + COUNTY_BATCH]
+            batch_trip_df = trip_df[trip_df['CTFIPS'].isin(batch_ids)]
+            with stage('batch %d' % (start // COUNTY_BATCH), rows_in=len(batch_trip_df),
+                       counties=len(batch_ids)) as record:
+                results.append(event_ttests(batch_trip_df, event, county2hurricane_dict, county2evacuation_dict,
+                                            county_id2geometry_dict))
+                record['rows_out'] = len(results[-1])
+        return pd.concat(results, ignore_index=True)
+
+    return cache.update_county_results('ttest', _ttest_key(event),
+                                       cache.county_fingerprints(trip_df, county_df), output_path, _test_counties)
+
+
+def hypothetical_tests_out_of_core(event, county2hurricane_dict, county2evacuation_dict, county_id2geometry_dict,
+                                   output_path="output_hypothetical_test.csv"):
+    """
+    7.1 hypothetical testing reading the store one state at a time, with the dates of the control window
+    pushed down to the scan. The tests of a county only use its own rows, so the results (and the cache)
+    are the same as with hypothetical_tests.
+    """
+    import pandas as pd
+    import cache
+    import outofcore
+    from events import event_ttests
+    from ttest_engine import TRIP_COLUMNS
+
+    logger.info("7.1 hypothetical testing, one state at a time...")
+    county_df = _county_inputs(county2hurricane_dict, county2evacuation_dict, county_id2geometry_dict)
+
+    def _state_trips():
+        return outofcore.state_trips(TRIP_COLUMNS, event.time_before, event.time_after)
+
+    # a first pass fingerprints the counties, a second one tests the changed counties
+    fingerprints = pd.concat([cache.county_fingerprints(trip_df, county_df)
+                              for _, trip_df in _state_trips()]).sort_index()
+
+    def _test_counties(county_ids):
+        results = []
+        for state, trip_df in _state_trips():
+            trip_df = trip_df[trip_df['CTFIPS'].isin(county_ids)]
+            if len(trip_df) == 0:
+                continue
+            with stage('state %d' % state, rows_in=len(trip_df)) as record:
+                results.append(event_ttests(trip_df, event, county2hurricane_dict, county2evacuation_dict,
+                                            county_id2geometry_dict))
+                record['rows_out'] = len(results[-1])
+        return pd.concat(results).sort_values('CTFIPs', kind='stable', ignore_index=True)
+
+    return cache.update_county_results('ttest', _ttest_key(event),
+                                       fingerprints, output_path, _test_counties)
+
+
+def resampling_tests(event, trip_df, hypothetical_df, method=RESAMPLING_METHOD, nb_resamples=NB_RESAMPLES,
+                     seed=SEED):
+    """7.1 permutation or bootstrap counterparts of the hypothetical tests"""
+    from events import event_resampling_tests
+
+    logger.info("7.1 %s tests...", method)
+    resampling_df = event_resampling_tests(trip_df, event, method, nb_resamples, seed)
+    resampling_df = resampling_df.reindex(hypothetical_df['CTFIPs'])
+    resampling_df.to_csv("output_%s_test.csv" % method)
+    return resampling_df
+
+
+def anova(hypothetical_df):
+    """Normality of the testing numbers and two-way ANOVA of the case differences"""
+    import scipy.stats as stats
+    import statsmodels.api as sm
+    from statsmodels.formula.api import ols
+
+    w, pvalue = stats.shapiro(hypothetical_df.after_testing)
+    logger.info('shapiro: %s %s', w, pvalue)
+
+    # Ordinary Least Squares (OLS) model
+    model = \
+        ols('case_difference ~ C(mobility_variation)+C(affected_hurricane)+C(mobility_variation):C(affected_hurricane)',
+            data=hypothetical_df).fit()
+    anova_table = sm.stats.anova_lm(model, type=2)
+    logger.info('\n%s', anova_table)
+    #
+    # from bioinfokit.analys import stat
+    # res = stat()
+    # res.tukey_hsd(df=hypothetical_df, res_var='case_difference',
+    #               xfac_var='affected_hurricane',
+    #               anova_model=
+    #               'case_difference ~ C(affected_hurricane)')
+    # print(res.tukey_summary)
+
+    # res = stat()
+    # res.levene(df=hypothetical_df, res_var='case_difference', xfac_var='affected_hurricane')
+    # print(res.levene)
+    return anova_table
+
+
+def _case_difference_test(sample_a, sample_b, method, nb_resamples, seed):
+    import scipy.stats as stats
+    from resampling import group_resampling_test
+
+    t_stat, p_value = stats.ttest_ind(a=sample_a, b=sample_b)
+    logger.info("t-test: %s", t_stat)
+    logger.info("p_value: %s", p_value)
+    if method is not None:
+        logger.info("%s p_value: %s", method, group_resampling_test(sample_a, sample_b, method, nb_resamples, seed)[1])
+    return t_stat, p_value
+
+
+def case_difference_tests(hypothetical_df, method=RESAMPLING_METHOD, nb_resamples=NB_RESAMPLES, seed=SEED):
+    """7.2 and 7.3 (tests 8 and 9) compare the covid cases differences between groups of counties"""
+    # test 8 compare affected counties and unaffected counties on covid cases differences
+    logger.info("7.2 compare affected counties and unaffected counties on covid cases differences....")
+    subset_df_affected = hypothetical_df[hypothetical_df.nb_affected_days > 0]
+    subset_df_unaffected = hypothetical_df[hypothetical_df.nb_affected_days == 0]
+    case_difference_sample_affected = subset_df_affected['case_difference'].to_list()
+    case_difference_sample_unaffected = subset_df_unaffected['case_difference'].to_list()
+    test_affected = _case_difference_test(case_difference_sample_affected, case_difference_sample_unaffected,
+                                          method, nb_resamples, seed)
+
+    # test 9 compare covid cases differences between counties with and without evacuation order
+    logger.info("7.3 compare affected counties and unaffected counties on covid cases differences....")
+    subset_df_order = \
+        hypothetical_df[(hypothetical_df.nb_affected_days > 0) &
+                        ~(hypothetical_df.evacuation_order != 'No evacuation order')]
+    subset_df_no_order = \
+        hypothetical_df[(hypothetical_df.nb_affected_days > 0) &
+                        ~(hypothetical_df.evacuation_order == 'No evacuation order')]
+
+    case_difference_sample_affected = subset_df_order['case_difference'].to_list()
+    case_difference_sample_unaffected = subset_df_no_order['case_difference'].to_list()
+    test_order = _case_difference_test(case_difference_sample_affected, case_difference_sample_unaffected,
+                                       method, nb_resamples, seed)
+    return test_affected, test_order
+
+
+def did(event, trip_df, county2hurricane_dict):
+    """7.4 difference-in-differences on the county-day panel, with county and date fixed effects"""
+    from panel import event_did
+
+    logger.info("7.4 difference-in-differences on the county-day panel...")
+    did_df = event_did(trip_df, event, county2hurricane_dict)
+    logger.info('\n%s', did_df)
+    did_df.to_csv("output_did.csv", index=False)
+    return did_df
+
+
+def _event_study_trips(event, trip_df):
+    # the curves need the days from landfall - 36 to landfall + 30, which the control window read by
+    # read_inputs does not cover with fewer control days: the window of the curves is then read instead
+    import pandas as pd
+    import store
+    from event_study import EVENT_STUDY_METRICS, event_study_window
+
+    first_day, last_day = event_study_window(event.landfall_date)
+    if pd.Timestamp(event.time_before) <= first_day and last_day <= pd.Timestamp(event.time_after):
+        return trip_df
+    return store.read_trips(columns=['CTFIPS', 'date_index'] + EVENT_STUDY_METRICS, start_date=first_day,
+                            end_date=last_day).set_index('date_index')
+
+
+def event_study(event, trip_df):
+    """7.5 event-study curves of every county and metric, relative days -30..+30 around landfall"""
+    from event_study import event_study_curves
+
+    logger.info("7.5 event-study curves around landfall...")
+    event_study_df = event_study_curves(_event_study_trips(event, trip_df), event)
+    event_study_df.to_csv("output_event_study.csv", index=False)
+    return event_study_df
+
+
+def event_study_out_of_core(event):
+    """7.5 event-study curves computed one state at a time, in the order of event_study"""
+    import outofcore
+    from event_study import EVENT_STUDY_METRICS, event_study_curves, event_study_window
+
+    logger.info("7.5 event-study curves around landfall, one state at a time...")
+    curves = []
+    # only the days of the curves are read, whatever the control window of the event
+    for state, trip_df in outofcore.state_trips(['CTFIPS', 'date_index'] + EVENT_STUDY_METRICS,
+                                                *event_study_window(event.landfall_date)):
+        with stage('state %d' % state, rows_in=len(trip_df)):
+            curves.append(event_study_curves(trip_df, event))
+    event_study_df = outofcore.concat_by_metric(curves, EVENT_STUDY_METRICS)
+    event_study_df.to_csv("output_event_study.csv", index=False)
+    return event_study_df
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Hypothetical tests of the hurricane event')
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES)
+    parser.add_argument('--resampling', choices=['permutation', 'bootstrap'], default=RESAMPLING_METHOD,
+                        help='also compute nonparametric p-values')
+    parser.add_argument('--nb-resamples', type=int, default=NB_RESAMPLES)
+    parser.add_argument('--seed', type=int, default=SEED)
+    parser.add_argument('--out-of-core', action='store_true', default=OUT_OF_CORE,
+                        help='read the trips of one state at a time, for trip tables larger than memory')
+    instrumentation.add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    import pandas as pd
+    from events import LAURA
+
+    pd.set_option('display.max_columns', None)
+    pd.set_option('display.max_rows', None)
+
+    event = LAURA
+    with instrumentation.run('testing', args):
+        with stage('inputs') as record:
+            trip_df, county2hurricane_dict, county2evacuation_dict, county_id2geometry_dict = \
+                read_inputs(event, args.out_of_core)
+            nb_rows = None if trip_df is None else len(trip_df)
+            record['rows_out'] = nb_rows
+
+        # the t-test results are read back from the cache when only the later stages run
+        if {'ttest', 'anova', 'case_difference'} & set(args.stages):
+            with stage('ttest', rows_in=nb_rows) as record:
+                if args.out_of_core:
+                    hypothetical_df = hypothetical_tests_out_of_core(event, county2hurricane_dict,
+                                                                     county2evacuation_dict, county_id2geometry_dict)
+                else:
+                    hypothetical_df = hypothetical_tests(event, trip_df, county2hurricane_dict, county2evacuation_dict,
+                                                         county_id2geometry_dict)
+                record['rows_out'] = len(hypothetical_df)
+            if 'ttest' in args.stages and args.resampling is not None:
+                from resampling import RESAMPLING_TESTS
+
+                # the chunks of counties share their random streams, so all the counties are resampled at once
+                resampling_trip_df = trip_df if trip_df is not None else _window_trips(
+                    event, ['CTFIPS', 'date_index', 'is_weekday'] + sorted({test[1] for test in RESAMPLING_TESTS}))
+                with stage('resampling', rows_in=len(resampling_trip_df), method=args.resampling) as record:
+                    record['rows_out'] = len(resampling_tests(event, resampling_trip_df, hypothetical_df,
+                                                              args.resampling, args.nb_resamples, args.seed))
+            if 'anova' in args.stages:
+                with stage('anova', rows_in=len(hypothetical_df)):
+                    anova(hypothetical_df)
+            if 'case_difference' in args.stages:
+                with stage('case_difference', rows_in=len(hypothetical_df)):
+                    case_difference_tests(hypothetical_df, args.resampling, args.nb_resamples, args.seed)
+        if 'did' in args.stages:
+            from panel import DID_METRICS
+
+            # the fixed effects tie all the counties together, the window is read with the columns of the model
+            did_trip_df = trip_df if trip_df is not None else _window_trips(event, ['CTFIPS', 'date_index'] +
+                                                                            DID_METRICS)
+            with stage('did', rows_in=len(did_trip_df)) as record:
+                record['rows_out'] = len(did(event, did_trip_df, county2hurricane_dict))
+        if 'event_study' in args.stages:
+            with stage('event_study', rows_in=nb_rows) as record:
+                if args.out_of_core:
+                    record['rows_out'] = len(event_study_out_of_core(event))
+                else:
+                    record['rows_out'] = len(event_study(event, trip_df))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+# Author: Xin (Bruce) Wu xwu03@villanova.edu
+# Villanova University
+# "Copyright 2023"
+
+# The out-of-core stages against the in-memory ones on a small synthetic store: the outputs must be
+# identical, whatever the scan order of the state partitions and the CTNAME categories of each store.
+
+import dataclasses
+import filecmp
+import os
+
+import pandas as pd
+import pytest
+
+import ingest
+import plotting
+import reading
+import testing
+from benchmarks import synthetic
+from events import LAURA
+from figures import daily_aggregates
+
+NB_COUNTIES = 60
+NB_DAYS = 245
+# several chunks per state when the SERA file is written to the store out of core
+CHUNK_SIZE = 2000
+# a control window shorter than the days before landfall used by the event-study curves
+SHORT_LAURA = dataclasses.replace(LAURA, control_days=30)
+
+
+def _run(directory, out_of_core):
+    # read the inputs into the store of directory as reading.py does, then run the trip stages
+    os.makedirs(directory)
+    synthetic.write_inputs(directory, NB_COUNTIES, NB_DAYS)
+    os.chdir(directory)
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        iter_sera = ingest.iter_sera
+        monkeypatch.setattr(ingest, 'iter_sera',
+                            lambda path, states, chunksize=None: iter_sera(path, states, CHUNK_SIZE))
+        reading.main(['--stages', 'hurricane', 'counties', 'trips'] + (['--out-of-core'] if out_of_core else []))
+
+    if out_of_core:
+        short_event_study_df = testing.event_study_out_of_core(SHORT_LAURA)
+    else:
+        short_event_study_df = testing.event_study(SHORT_LAURA, testing.read_inputs(SHORT_LAURA)[0])
+
+    trip_df, county2hurricane_dict, county2evacuation_dict, county_id2geometry_dict = \
+        testing.read_inputs(LAURA, out_of_core)
+    if out_of_core:
+        hypothetical_df = testing.hypothetical_tests_out_of_core(LAURA, county2hurricane_dict, county2evacuation_dict,
+                                                                 county_id2geometry_dict)
+        event_study_df = testing.event_study_out_of_core(LAURA)
+        aggregates = plotting.annotate_out_of_core(LAURA)
+    else:
+        hypothetical_df = testing.hypothetical_tests(LAURA, trip_df, county2hurricane_dict, county2evacuation_dict,
+                                                     county_id2geometry_dict)
+        event_study_df = testing.event_study(LAURA, trip_df)
+        start_date, end_date = plotting.plot_window(LAURA)
+        aggregates = daily_aggregates(plotting.annotate(LAURA).loc[start_date:end_date])
+    return {'hypothetical': hypothetical_df, 'event_study': event_study_df, 'aggregates': aggregates,
+            'short_event_study': short_event_study_df}
+
+
+@pytest.fixture(scope='module')
+def outputs(tmp_path_factory):
+    cwd = os.getcwd()
+    root = tmp_path_factory.mktemp('outofcore')
+    try:
+        return {mode: _run(str(root / mode), mode == 'out_of_core') for mode in ['in_memory', 'out_of_core']}, root
+    finally:
+        os.chdir(cwd)
+
+
+@pytest.mark.parametrize('name', ['hypothetical', 'event_study', 'aggregates', 'short_event_study'])
+def test_frames(outputs, name):
+    outputs, _ = outputs
+    pd.testing.assert_frame_equal(outputs['out_of_core'][name], outputs['in_memory'][name])
+
+
+@pytest.mark.parametrize('file_name', ['output_hypothetical_test.csv', 'output_event_study.csv',
+                                       'output_focused_data.csv'])
+def test_csv_files(outputs, file_name):
+    _, root = outputs
+    assert filecmp.cmp(root / 'in_memory' / file_name, root / 'out_of_core' / file_name, shallow=False)
+
+
+@pytest.mark.parametrize('mode', ['in_memory', 'out_of_core'])
+def test_short_control_window(outputs, mode):
+    # the curves do not depend on the control window of the event
+    outputs, _ = outputs
+    pd.testing.assert_frame_equal(outputs[mode]['short_event_study'], outputs[mode]['event_study'])
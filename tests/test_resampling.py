@@ -0,0 +1,44 @@
+# Author: Xin (Bruce) Wu xwu03@villanova.edu
+# Villanova University
+# "Copyright 2023"
+
+# Level of the batched resampling tests: on rows without effect, the share of p-values below alpha
+# should be close to alpha.
+
+import numpy as np
+import pytest
+
+from resampling import RESAMPLING_METHODS
+
+ALPHA = 0.05
+# as many rows as null hypotheses, with the weekday sample and control days of a hurricane window
+NB_ROWS = 600
+NB_SAMPLE_DAYS = 4
+NB_CONTROL_DAYS = 84
+NB_RESAMPLES = 500
+
+
+@pytest.mark.parametrize('one_sample', [False, True])
+@pytest.mark.parametrize('method', sorted(RESAMPLING_METHODS))
+def test_null_rejection_rate(method, one_sample):
+    rng = np.random.default_rng(0)
+    sample = rng.normal(size=(NB_ROWS, NB_SAMPLE_DAYS))
+    control = rng.normal(size=(NB_ROWS, NB_CONTROL_DAYS))
+    _, p_value = RESAMPLING_METHODS[method](sample, control, NB_RESAMPLES, np.random.default_rng(1),
+                                            one_sample=one_sample)
+    # about four standard errors of the binomial share around alpha
+    assert abs(np.mean(p_value < ALPHA) - ALPHA) < 0.035
+
+
+@pytest.mark.parametrize('method', sorted(RESAMPLING_METHODS))
+def test_missing_values(method):
+    rng = np.random.default_rng(0)
+    sample = rng.normal(size=(3, NB_SAMPLE_DAYS))
+    control = rng.normal(size=(3, NB_CONTROL_DAYS))
+    # no sample value, and a row with missing values among the control days
+    sample[0] = np.nan
+    control[1, :10] = np.nan
+    diff, p_value = RESAMPLING_METHODS[method](sample, control, NB_RESAMPLES, np.random.default_rng(1))
+    assert np.isnan(diff[0]) and np.isnan(p_value[0])
+    assert np.isclose(diff[1], sample[1].mean() - np.nanmean(control[1]))
+    assert 0.0 < p_value[1] <= 1.0 and 0.0 < p_value[2] <= 1.0
@@ -0,0 +1,158 @@
+# Author: Xin (Bruce) Wu xwu03@villanova.edu
+# Villanova University
+# "Copyright 2023"
+
+# The vectorized per-county t-tests against the per-county loop of the original testing.py step 7.1.
+
+import warnings
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+import scipy.stats as stats
+
+from ttest_engine import county_ttests
+
+HURRICANE_START_DATE = date(2020, 8, 23)
+HURRICANE_END_DATE = date(2020, 8, 27)
+TIME_BEFORE = HURRICANE_START_DATE - timedelta(days=60)
+TIME_AFTER = HURRICANE_END_DATE + timedelta(days=60)
+TIME_BEFORE_COVID = HURRICANE_START_DATE - timedelta(days=9)
+TIME_AFTER_COVID = HURRICANE_END_DATE + timedelta(days=14)
+
+COUNTY_IDS = [1001, 1003, 22001, 22003, 48001]
+
+
+def _county_day_frame(seed=0):
+    # county-day trips of the control window, indexed by date, with float32 attributes as in the store
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(TIME_BEFORE, TIME_AFTER)
+    frames = []
+    for i, county_id in enumerate(COUNTY_IDS):
+        n = len(dates)
+        trips_person = rng.normal(3.0 + i, 0.5, n)
+        population = 10.0 ** (3 + i)
+        frames.append(pd.DataFrame({
+            'CTFIPS': county_id, 'CTNAME': 'County %d' % county_id, 'STFIPS': county_id // 1000,
+            'is_weekday': dates.weekday < 5,
+            'Trips/person': trips_person,
+            # large values, where the variance needs the shifted sums
+            'Trips': trips_person * population,
+            'Out-of-county trips/person': trips_person * rng.uniform(0.1, 0.3, n),
+            'Out-of-state trips/person': trips_person * rng.uniform(0.0, 0.05, n),
+            'Miles/person': rng.normal(25.0, 4.0, n),
+            '% working from home': rng.uniform(5.0, 30.0, n),
+            'New cases/1000 people': rng.gamma(2.0, 0.1, n),
+            'Tests done/1000 people': rng.gamma(5.0, 0.5, n)}, index=pd.Index(dates, name='date_index')))
+    trip_df = pd.concat(frames)
+    float_columns = trip_df.columns[trip_df.dtypes == np.float64]
+    trip_df[float_columns] = trip_df[float_columns].astype(np.float32)
+
+    in_range = trip_df.index.isin(pd.date_range(HURRICANE_START_DATE, HURRICANE_END_DATE))
+    # missing values inside and outside of the hurricane window
+    trip_df.loc[(trip_df['CTFIPS'] == 1003).to_numpy() & in_range & trip_df['is_weekday'].to_numpy(),
+                'Miles/person'] = np.nan
+    trip_df.iloc[np.flatnonzero((trip_df['CTFIPS'] == 22001).to_numpy())[[3, 40]],
+                 trip_df.columns.get_loc('Trips')] = np.nan
+    trip_df.iloc[np.flatnonzero((trip_df['CTFIPS'] == 48001).to_numpy())[[70, 71]],
+                 trip_df.columns.get_loc('New cases/1000 people')] = np.nan
+    # a county with a single weekday in the hurricane window
+    single = (trip_df['CTFIPS'] == 22003).to_numpy() & in_range & trip_df['is_weekday'].to_numpy()
+    return trip_df.loc[~(single & (trip_df.index > trip_df.index[single].min()))]
+
+
+def _loop_ttests(focused_trip_df, county2hurricane_dict, county2evacuation_dict):
+    # the per-county loop of the original testing.py, with the out-of-state population mean taken from
+    # the out-of-state column; the original read the attributes as float64
+    float_columns = focused_trip_df.columns[focused_trip_df.dtypes == np.float32]
+    focused_trip_df = focused_trip_df.astype(dict.fromkeys(float_columns, np.float64))
+    focused_trip_df['in_hurricane_range'] = \
+        focused_trip_df.index.isin(pd.date_range(HURRICANE_START_DATE, HURRICANE_END_DATE))
+    rows = []
+    for county_id, subset in focused_trip_df.groupby('CTFIPS'):
+        weekday = subset[subset.is_weekday]
+        sample = subset[subset.is_weekday & subset.in_hurricane_range]
+        control = subset[subset.is_weekday & (~subset.in_hurricane_range)]
+        before = subset.loc[subset.index.isin(pd.date_range(TIME_BEFORE_COVID, HURRICANE_END_DATE))]
+        after = subset.loc[subset.index.isin(pd.date_range(HURRICANE_END_DATE, TIME_AFTER_COVID))]
+
+        def _two_sample(attribute, alternative='two-sided'):
+            return stats.ttest_ind(a=sample[attribute].to_list(), b=control[attribute].to_list(),
+                                   alternative=alternative)
+
+        row = {'CTFIPs': county_id, 'nb_affected_days': county2hurricane_dict[county_id],
+               'evacuation_order': county2evacuation_dict.get(county_id, 'No evacuation order'),
+               'pop_trip_mean': weekday['Trips/person'].mean(), 'pop_trip_var': weekday['Trips/person'].var(),
+               'sample_trip_mean': sample['Trips/person'].mean(),
+               'pop_out_of_county_trip_mean': weekday['Out-of-county trips/person'].mean(),
+               'sample_out_of_county_trip_mean': sample['Out-of-county trips/person'].mean(),
+               'pop_out_of_state_trip_mean': weekday['Out-of-state trips/person'].mean(),
+               'sample_out_of_state_trip_mean': sample['Out-of-state trips/person'].mean(),
+               'pop_mile_mean': weekday['Miles/person'].mean(), 'sample_mile_mean': sample['Miles/person'].mean()}
+        row['t_stat_1samp_person_trip'], row['p_value_1samp_person_trip'] = \
+            stats.ttest_1samp(a=sample['Trips/person'].to_list(), popmean=row['pop_trip_mean'])
+        row['t_stat_2samp_person_trip'], row['p_value_2samp_person_trip'] = _two_sample('Trips/person')
+        row['t_stat_2samp_total_trip'], row['p_value_2samp_total_trip'] = _two_sample('Trips')
+        row['t_stat_2samp_out_ct_trip'], row['p_value_2samp_out_ct_trip'] = \
+            _two_sample('Out-of-county trips/person', alternative='less')
+        row['t_stat_2samp_out_st_trip'], row['p_value_2samp_out_st_trip'] = \
+            _two_sample('Out-of-state trips/person', alternative='less')
+        row['t_stat_2samp_person_mile'], row['p_value_2samp_person_mile'] = _two_sample('Miles/person')
+        row['t_stat_2samp_perc_work_home'], row['p_value_2samp_perc_work_home'] = \
+            _two_sample('% working from home')
+        row['after_cases'] = after['New cases/1000 people'].mean()
+        row['before_cases'] = before['New cases/1000 people'].mean()
+        row['case_difference'] = row['after_cases'] - row['before_cases']
+        row['after_testing'] = after['Tests done/1000 people'].mean()
+        row['before_testing'] = before['Tests done/1000 people'].mean()
+        row['test_difference'] = row['after_testing'] - row['before_testing']
+        row['mobility_variation'] = row['t_stat_2samp_person_trip'] > 0
+        row['affected_hurricane'] = row['nb_affected_days'] > 0
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+@pytest.fixture(scope='module')
+def results():
+    focused_trip_df = _county_day_frame()
+    in_range = focused_trip_df.index.isin(pd.date_range(HURRICANE_START_DATE, HURRICANE_END_DATE))
+    county2hurricane_dict = dict(zip(COUNTY_IDS, [0, 2, 5, 1, 0]))
+    county2evacuation_dict = {22001: 'Mandatory', 22003: 'Voluntary'}
+    county_id2geometry_dict = {county_id: None for county_id in COUNTY_IDS}
+    engine_df = county_ttests(focused_trip_df, in_range, county2hurricane_dict, county2evacuation_dict,
+                              county_id2geometry_dict, TIME_BEFORE_COVID, HURRICANE_END_DATE, TIME_AFTER_COVID)
+    with warnings.catch_warnings():
+        # scipy warns on the windows with a single value or missing values
+        warnings.simplefilter('ignore')
+        loop_df = _loop_ttests(focused_trip_df, county2hurricane_dict, county2evacuation_dict)
+    return engine_df, loop_df
+
+
+def test_columns(results):
+    engine_df, loop_df = results
+    assert engine_df.columns.is_unique
+    assert set(loop_df.columns) <= set(engine_df.columns)
+    np.testing.assert_array_equal(engine_df['CTFIPs'].to_numpy(), loop_df['CTFIPs'].to_numpy())
+
+
+def test_matches_loop(results):
+    engine_df, loop_df = results
+    for column in loop_df.columns:
+        if loop_df[column].dtype.kind == 'f':
+            np.testing.assert_allclose(engine_df[column].to_numpy(dtype=float), loop_df[column].to_numpy(),
+                                       rtol=1e-9, atol=1e-12, equal_nan=True, err_msg=column)
+        else:
+            assert engine_df[column].tolist() == loop_df[column].tolist(), column
+
+
+def test_edge_cases(results):
+    engine_df, loop_df = results
+    engine_df = engine_df.set_index('CTFIPs')
+    # a missing value in the window leaves the test without result, as scipy propagates it
+    assert np.isnan(engine_df.loc[1003, 't_stat_2samp_person_mile'])
+    assert np.isnan(engine_df.loc[22001, 't_stat_2samp_total_trip'])
+    # a single sample day has no variance
+    assert np.isnan(engine_df.loc[22003, 't_stat_1samp_person_trip'])
+    assert not np.isnan(engine_df.loc[22003, 'sample_trip_mean'])
+    assert not np.isnan(engine_df.loc[22003, 't_stat_2samp_person_trip'])
@@ -0,0 +1,103 @@
+# Author: Xin (Bruce) Wu xwu03@villanova.edu
+# Villanova University
+# "Copyright 2023"
+
+import numpy as np
+import pandas as pd
+import shapely
+
+from county_geometry import PROJECTED_CRS
+from ingest import GULF_STATES
+
+NAUTICAL_MILE = 1852.0
+QUADRANTS = ['ne', 'se', 'sw', 'nw']
+
+
+def read_track(path, wind_radii='r34'):
+    """
+    Read a HURDAT-style storm track: one row per fix with the columns datetime (UTC), lat, lon (decimal
+    degrees, west negative) and the wind radii of each quadrant in nautical miles (r34_ne, r34_se, r34_sw,
+    r34_nw for the 34 kt wind field).
+    """
+    track = pd.read_csv(path, parse_dates=['datetime'])
+    columns = ['datetime', 'lat', 'lon'] + [wind_radii + '_' + quadrant for quadrant in QUADRANTS]
+    track = track[columns].sort_values('datetime').reset_index(drop=True)
+    track.columns = ['datetime', 'lat', 'lon'] + QUADRANTS
+    track[QUADRANTS] = track[QUADRANTS].fillna(0) * NAUTICAL_MILE
+    return track
+
+
+def interpolate_track(track, step='1H'):
+    """Project the track and interpolate the positions and wind radii linearly in time"""
+    import geopandas as gpd
+
+    points = gpd.GeoSeries(gpd.points_from_xy(track['lon'], track['lat']), crs=4326).to_crs(epsg=PROJECTED_CRS)
+    projected = pd.DataFrame({'x': points.x.to_numpy(), 'y': points.y.to_numpy()}, index=track['datetime'])
+    projected[QUADRANTS] = track[QUADRANTS].to_numpy()
+    times = pd.date_range(track['datetime'].iloc[0], track['datetime'].iloc[-1], freq=step)
+    projected = projected[~projected.index.duplicated()]
+    return projected.reindex(projected.index.union(times)).interpolate(method='time').loc[times]
+
+
+def wind_field_polygons(x, y, radii, nb_vertices=16):
+    """Wind field polygon around each track point, one circular arc per quadrant (radii in meters)"""
+    # bearings clockwise from north, NE quadrant first
+    bearings = np.radians(np.linspace(0, 90, nb_vertices)[None, :] + 90 * np.arange(4)[:, None])
+    dx = (radii[:, :, None] * np.sin(bearings)[None]).reshape(len(x), -1)
+    dy = (radii[:, :, None] * np.cos(bearings)[None]).reshape(len(x), -1)
+    coords = np.stack([x[:, None] + dx, y[:, None] + dy], axis=-1)
+    return shapely.polygons(np.concatenate([coords, coords[:, :1]], axis=1))
+
+
+def wind_swaths(track_points, nb_vertices=16):
+    """Area swept by the wind field between consecutive track points: the hull of both wind fields"""
+    radii = track_points[QUADRANTS].to_numpy()
+    polygons = wind_field_polygons(track_points['x'].to_numpy(), track_points['y'].to_numpy(), radii, nb_vertices)
+    if len(polygons) == 1:
+        return polygons
+    coords = shapely.get_coordinates(polygons).reshape(len(polygons), -1, 2)
+    pairs = np.concatenate([coords[:-1], coords[1:]], axis=1)
+    indices = np.repeat(np.arange(len(pairs)), pairs.shape[1])
+    return shapely.convex_hull(shapely.multipoints(pairs.reshape(-1, 2), indices=indices))
+
+
+def track_exposure(track, county_geometry, utc_offset, states=GULF_STATES, step='1H'):
+    """
+    Per-county, per-day hurricane exposure from a storm track, in the schema of the melted hurricane
+    table (CTFIPS, CTNAME, nb_affected_day, date, affected, date_index). A county is affected on a day
+    when a wind swath of that day intersects it. utc_offset (hours, e.g. -5 for CDT) converts the UTC
+    track times to the local calendar days of the SERA data.
+    """
+    track_points = interpolate_track(track, step)
+    swaths = wind_swaths(track_points)
+    swath_times = track_points.index[:len(swaths)] + pd.Timedelta(hours=utc_offset)
+
+    # drop the swaths between two points without wind field
+    radii = track_points[QUADRANTS].to_numpy().max(axis=1)
+    if len(radii) > 1:
+        radii = np.maximum(radii[:-1], radii[1:])
+    has_wind = radii > 0
+    swaths, swath_times = swaths[has_wind], swath_times[has_wind]
+
+    # counties intersected by each swath, through the spatial index of the counties
+    swath_index, county_ids = county_geometry.intersecting(swaths)
+    affected_pairs = pd.DataFrame({'CTFIPS': county_ids, 'date_index': swath_times[swath_index].normalize()})
+    affected_pairs = affected_pairs.drop_duplicates()
+
+    counties = county_geometry.centroids
+    if states is not None:
+        counties = counties[counties['STFIPS'].isin(states)]
+    county_ids = counties['CTFIPS'].to_numpy()
+    days = pd.date_range(swath_times.min().normalize(), swath_times.max().normalize())
+
+    # one row per (date, county), in the order of pd.melt
+    melted_df = pd.DataFrame({'CTFIPS': np.tile(county_ids, len(days)),
+                              'CTNAME': np.tile(counties['NAME'].to_numpy(), len(days)),
+                              'date': np.repeat([f"{day.month}/{day.day}/{day.year}" for day in days], len(county_ids)),
+                              'date_index': np.repeat(days, len(county_ids))})
+    affected_pairs['affected'] = 1
+    melted_df = melted_df.merge(affected_pairs, on=['CTFIPS', 'date_index'], how='left')
+    melted_df['affected'] = melted_df['affected'].fillna(0).astype(int)
+    melted_df['nb_affected_day'] = melted_df.groupby('CTFIPS')['affected'].transform('sum')
+    return melted_df[['CTFIPS', 'CTNAME', 'nb_affected_day', 'date', 'affected', 'date_index']]
+
@@ -0,0 +1,201 @@
+# Author: Xin (Bruce) Wu xwu03@villanova.edu
+# Villanova University
+# "Copyright 2023"
+
+import numpy as np
+import pandas as pd
+
+# Declarative configuration of the per-county tests of testing.py step 7.1. Every entry is evaluated from
+# per-county sufficient statistics (number of values, sum and sum of squares of each metric in each
+# window) computed in one grouped pass, so a metric or a test is one more entry, not another pass.
+
+# hypothesis tests: (name, metric, kind, alternative); the one-sample tests compare the sample window with
+# the population mean, the two-sample tests the sample and control windows. Written as t_stat_<name>
+# and p_value_<name>.
+TTESTS = [('1samp_person_trip', 'Trips/person', 'one-sample', 'two-sided'),
+          ('2samp_person_trip', 'Trips/person', 'two-sample', 'two-sided'),
+          ('2samp_total_trip', 'Trips', 'two-sample', 'two-sided'),
+          ('2samp_out_ct_trip', 'Out-of-county trips/person', 'two-sample', 'less'),
+          ('2samp_out_st_trip', 'Out-of-state trips/person', 'two-sample', 'less'),
+          ('2samp_person_mile', 'Miles/person', 'two-sample', 'two-sided'),
+          ('2samp_perc_work_home', '% working from home', 'two-sample', 'two-sided')]
+
+# descriptive columns: (column, statistic, window, metric)
+COUNTY_STATISTICS = [('pop_trip_mean', 'mean', 'population', 'Trips/person'),
+                     ('pop_trip_var', 'var', 'population', 'Trips/person'),
+                     ('sample_trip_mean', 'mean', 'sample', 'Trips/person'),
+                     ('pop_out_of_county_trip_mean', 'mean', 'population', 'Out-of-county trips/person'),
+                     ('sample_out_of_county_trip_mean', 'mean', 'sample', 'Out-of-county trips/person'),
+                     ('pop_out_of_state_trip_mean', 'mean', 'population', 'Out-of-state trips/person'),
+                     ('sample_out_of_state_trip_mean', 'mean', 'sample', 'Out-of-state trips/person'),
+                     ('pop_mile_mean', 'mean', 'population', 'Miles/person'),
+                     ('sample_mile_mean', 'mean', 'sample', 'Miles/person')]
+
+# differences of the covid means after and before the end of the hurricane: (column, after column,
+# before column, metric)
+DIFFERENCES = [('case_difference', 'after_cases', 'before_cases', 'New cases/1000 people'),
+               ('test_difference', 'after_testing', 'before_testing', 'Tests done/1000 people')]
+
+# metrics of the configured tests and columns, and the columns of the trip table read by the tests
+TEST_METRICS = list(dict.fromkeys([test[1] for test in TTESTS] + [column[3] for column in COUNTY_STATISTICS] +
+                                  [difference[3] for difference in DIFFERENCES]))
+TRIP_COLUMNS = ['CTFIPS', 'CTNAME', 'STFIPS', 'date_index', 'is_weekday'] + TEST_METRICS
+
+
+def test_windows(focused_trip_df, in_range, time_before_covid, hurricane_end_date, time_after_covid):
+    """
+    The windows of the tests as boolean masks over the rows: all weekdays (population), weekdays in the
+    hurricane range (sample), the other weekdays (control), and all days of the covid periods before and
+    after the end of the hurricane
+    """
+    weekday = focused_trip_df['is_weekday'].to_numpy(dtype=bool)
+    in_range = np.asarray(in_range, dtype=bool)
+    dates = focused_trip_df.index
+    return {'population': weekday, 'sample': weekday & in_range, 'control': weekday & ~in_range,
+            'before': dates.isin(pd.date_range(time_before_covid, hurricane_end_date)),
+            'after': dates.isin(pd.date_range(hurricane_end_date, time_after_covid))}
+
+
+def window_metrics(tests=TTESTS, statistics=COUNTY_STATISTICS, differences=DIFFERENCES):
+    """The (window, metric) pairs whose sufficient statistics the configured tests and columns use"""
+    pairs = []
+    for _, metric, kind, _ in tests:
+        pairs += [('sample', metric), ('population' if kind == 'one-sample' else 'control', metric)]
+    pairs += [(window, metric) for _, _, window, metric in statistics]
+    pairs += [(window, metric) for _, _, _, metric in differences for window in ['after', 'before']]
+    return list(dict.fromkeys(pairs))
+
+
+def sufficient_stats(focused_trip_df, windows, pairs, county_index):
+    """
+    Sufficient statistics of each county for the (window, metric) pairs, in a single grouped sum over the
+    rows: the number of rows of each window ('size') and the number, sum and sum of squares of the values
+    ('n', 'sum', 'sumsq'). The values are shifted by the first value of their county, so the variance
+    does not lose precision to large means (e.g. total trips). Returns the statistics with (statistic,
+    window, metric) columns indexed by county, and the shifts.
+    """
+    metrics = list(dict.fromkeys(metric for _, metric in pairs))
+    # the float32 attributes are aggregated in double precision
+    values_df = focused_trip_df[metrics].astype(np.float64)
+    county_ids = focused_trip_df['CTFIPS'].to_numpy()
+    shift = values_df.groupby(county_ids).first().reindex(county_index)
+    county_codes = county_index.get_indexer(county_ids)
+
+    columns = {('size', window, ''): windows[window].astype(np.int64)
+               for window in dict.fromkeys(window for window, _ in pairs)}
+    for window, metric in pairs:
+        values = values_df[metric].to_numpy() - shift[metric].to_numpy()[county_codes]
+        has_value = windows[window] & ~np.isnan(values)
+        columns[('n', window, metric)] = has_value.astype(np.int64)
+        columns[('sum', window, metric)] = np.where(has_value, values, 0.0)
+        columns[('sumsq', window, metric)] = np.where(has_value, values * values, 0.0)
+    stats = pd.DataFrame(columns).groupby(county_ids).sum().reindex(county_index, fill_value=0)
+    return stats, shift
+
+
+def window_mean(stats, shift, window, metric):
+    """Mean of the values of a metric in a window for every county, NaN without values"""
+    n = stats['n', window, metric].to_numpy()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(n > 0, shift[metric].to_numpy() + stats['sum', window, metric].to_numpy() / n, np.nan)
+
+
+def window_var(stats, window, metric):
+    """Sample variance (ddof=1) of a metric in a window for every county, NaN with fewer than two values"""
+    n = stats['n', window, metric].to_numpy()
+    total = stats['sum', window, metric].to_numpy()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        var = np.maximum(stats['sumsq', window, metric].to_numpy() - total * total / n, 0.0) / (n - 1)
+    return np.where(n > 1, var, np.nan)
+
+
+def _p_value(t_stat, dof, alternative):
+    # scipy.stats is slow to import, it is only loaded when a test runs
+    import scipy.stats as stats
+
+    if alternative == 'less':
+        return stats.t.cdf(t_stat, dof)
+    if alternative == 'greater':
+        return stats.t.sf(t_stat, dof)
+    return 2 * stats.t.sf(np.abs(t_stat), dof)
+
+
+def ttest_1samp(mean, var, n, popmean, has_nan, alternative='two-sided'):
+    """One sample t-test for every county at once (same result as stats.ttest_1samp)"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        dof = n - 1.0
+        t_stat = (mean - popmean) / np.sqrt(var / n)
+        p_value = _p_value(t_stat, dof, alternative)
+    t_stat = np.where(has_nan | (n < 1), np.nan, t_stat)
+    p_value = np.where(has_nan | (n < 1), np.nan, p_value)
+    return t_stat, p_value
+
+
+def ttest_ind(mean_a, var_a, n_a, mean_b, var_b, n_b, has_nan, alternative='two-sided'):
+    """Two sample t-test with pooled variance for every county at once (same result as stats.ttest_ind)"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        dof = n_a + n_b - 2.0
+        # a group with a single value adds nothing to the pooled variance, as in stats.ttest_ind
+        pooled_var = (np.where(n_a > 1, (n_a - 1) * var_a, 0.0) + np.where(n_b > 1, (n_b - 1) * var_b, 0.0)) / dof
+        t_stat = (mean_a - mean_b) / np.sqrt(pooled_var * (1.0 / n_a + 1.0 / n_b))
+        p_value = _p_value(t_stat, dof, alternative)
+    invalid = has_nan | (n_a < 1) | (n_b < 1)
+    t_stat = np.where(invalid, np.nan, t_stat)
+    p_value = np.where(invalid, np.nan, p_value)
+    return t_stat, p_value
+
+
+def county_ttests(focused_trip_df, in_range, county2hurricane_dict, county2evacuation_dict, county_id2geometry_dict,
+                  time_before_covid, hurricane_end_date, time_after_covid, tests=TTESTS, statistics=COUNTY_STATISTICS,
+                  differences=DIFFERENCES):
+    """
+    Run the per-county hypothetical tests of testing.py step 7.1 for all counties in one pass.
+
+    focused_trip_df is indexed by date and carries the 'is_weekday' flag; in_range marks its rows within
+    the hurricane range. The sufficient statistics of every window and metric are computed once, then
+    each configured test and column is evaluated from them with array-wise t-distribution calls. Returns
+    the columns of output_hypothetical_test.csv.
+    """
+    counties = focused_trip_df.drop_duplicates('CTFIPS').set_index('CTFIPS').sort_index()
+    county_index = counties.index
+
+    windows = test_windows(focused_trip_df, in_range, time_before_covid, hurricane_end_date, time_after_covid)
+    stats, shift = sufficient_stats(focused_trip_df, windows, window_metrics(tests, statistics, differences),
+                                    county_index)
+
+    def _has_nan(window, metric):
+        # scipy propagates missing values, a window with any of them has no test result
+        return (stats['n', window, metric] < stats['size', window, '']).to_numpy()
+
+    nb_affected_days = np.array([county2hurricane_dict[county_id] for county_id in county_index])
+    columns = {'CTFIPs': county_index.to_numpy(), 'CTNAME': counties['CTNAME'].to_numpy(),
+               'STFIPs': counties['STFIPS'].to_numpy(), 'nb_affected_days': nb_affected_days,
+               'evacuation_order': [county2evacuation_dict.get(county_id, 'No evacuation order')
+                                    for county_id in county_index]}
+    for column, statistic, window, metric in statistics:
+        columns[column] = window_mean(stats, shift, window, metric) if statistic == 'mean' else \
+            window_var(stats, window, metric)
+
+    # the t-tests use all rows of a window as sample size, a missing value invalidates the test
+    s_size = stats['size', 'sample', ''].to_numpy()
+    for name, metric, kind, alternative in tests:
+        s_mean, s_var = window_mean(stats, shift, 'sample', metric), window_var(stats, 'sample', metric)
+        if kind == 'one-sample':
+            t_stat, p_value = ttest_1samp(s_mean, s_var, s_size, window_mean(stats, shift, 'population', metric),
+                                          _has_nan('sample', metric), alternative)
+        else:
+            t_stat, p_value = ttest_ind(s_mean, s_var, s_size, window_mean(stats, shift, 'control', metric),
+                                        window_var(stats, 'control', metric), stats['size', 'control', ''].to_numpy(),
+                                        _has_nan('sample', metric) | _has_nan('control', metric), alternative)
+        columns['t_stat_' + name], columns['p_value_' + name] = t_stat, p_value
+
+    # average cases and testing numbers before and after the end of hurricane
+    for column, after_column, before_column, metric in differences:
+        after = window_mean(stats, shift, 'after', metric)
+        before = window_mean(stats, shift, 'before', metric)
+        columns[column], columns[after_column], columns[before_column] = after - before, after, before
+
+    columns['geometry'] = [county_id2geometry_dict[county_id] for county_id in county_index]
+    columns['mobility_variation'] = columns['t_stat_2samp_person_trip'] > 0
+    columns['affected_hurricane'] = nb_affected_days > 0
+    return pd.DataFrame(columns)